@@ -0,0 +1,455 @@
+import struct, re, fnmatch, zlib, threading
+import numpy as np
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from decompression import zflag_decompress, special_decompress, load_zstd_dict, zstd_decompressor, lz4_block_head, ZSTD_DICT_MAGIC
+from decryption import decryption_algorithm, file_decrypt, file_decrypt_at, file_decrypt_batch, check_range
+from detection import get_compression, get_ext, get_stream_ext, container_type, STREAM_HEAD
+from index import decode_index, INDEX_FIELDS
+from key import Keys
+from reader import NpkReader
+from cache import load_cache, save_cache, HEADER_FIELDS
+from names import NameTable, DirectoryTrie
+
+#one entry of the NPK index, name is the NXFN path (with / separators) or None if the NPK has no NXFN data
+NpkEntry = namedtuple('NpkEntry', ('index',) + INDEX_FIELDS + ('name',))
+
+#the index goes from index_offset to the end of the file (when there are no NXFN names after it), so the size of
+#each entry comes from the file size alone, nothing after the header is read
+def determine_info_size(f, var1, hashmode, encryptmode, index_offset, files):
+    if encryptmode == 256:
+        return 0x1C
+    return max(file_size(f) - index_offset, 0) // files
+
+def file_size(f):
+    position = f.tell()
+    size = f.seek(0, 2)
+    f.seek(position)
+    return size
+
+#the NXFN name table is read this much at a time
+NAMES_CHUNK = 1 << 20
+
+#the bytes between start and end in one buffer, read a chunk at a time
+def read_blob(f, start, end, chunk_size=NAMES_CHUNK):
+    blob = bytearray(max(end - start, 0))
+    view = memoryview(blob)
+    f.seek(start)
+    position = 0
+    while position < len(blob):
+        read = f.readinto(view[position:position + chunk_size])
+        if not read:
+            break
+        position += read
+    view.release()
+    del blob[position:]
+    return blob
+
+#the NXFN names between start and end (names are separated by an empty byte, empty names are skipped), read and split
+#a chunk at a time so the table is never in memory twice
+def read_nxfn_names(f, start, end, chunk_size=NAMES_CHUNK):
+    f.seek(start)
+    rest = b''
+    position = start
+    while position < end:
+        chunk = f.read(min(chunk_size, end - position))
+        if not chunk:
+            break
+        position += len(chunk)
+        names = (rest + chunk).split(b'\x00')
+        rest = names.pop()
+        yield from (name for name in names if name)
+    if rest:
+        yield rest
+
+def readuint64(f):
+    return struct.unpack('Q', f.read(8))[0]
+def readuint32(f):
+    return struct.unpack('I', f.read(4))[0]
+def readuint16(f):
+    return struct.unpack('H', f.read(2))[0]
+def readuint8(f):
+    return struct.unpack('B', f.read(1))[0]
+
+#turns a list of globs into one case insensitive regex (None if there are no globs)
+def compile_globs(patterns):
+    if not patterns:
+        return None
+    return re.compile("|".join(fnmatch.translate(pattern.replace("\\", "/")) for pattern in patterns), re.IGNORECASE)
+
+#the decoding chain of an entry up to the rotor / NXS3 step: EXPK XOR -> file flag decryption -> zflag decompression
+#zstd_dict is the raw zstd dictionary used by the zstd entries (if they were compressed with one)
+def decompress_entry(data, keys, pkg_type, file_flag, zflag, crc, file_length, file_original_length, key=0, zstd_dict=None):
+    if pkg_type:
+        data = keys.decrypt(data)
+    data = file_decrypt(file_flag, data, key, crc, file_length, file_original_length)
+    return zflag_decompress(zflag, data, file_original_length, zstd_dict)
+
+#the whole decoding chain of an entry: decompress_entry -> rotor / NXS3
+#returns the data and the special compression that was found (zip data is returned as it is)
+def decode_entry(data, keys, pkg_type, file_flag, zflag, crc, file_length, file_original_length, key=0, zstd_dict=None):
+    data = decompress_entry(data, keys, pkg_type, file_flag, zflag, crc, file_length, file_original_length, key, zstd_dict)
+    compression = get_compression(data)
+    data = special_decompress(compression, data)
+    return data, compression
+
+#entries up to this size are read and decrypted together by decrypt_entries
+BATCH_ENTRY = 1 << 16
+
+#the stored data of several entries (items are index tuples, see INDEX_FIELDS) with the EXPK XOR and the file flag
+#decryption done, the file flags of all of them in one file_decrypt_batch call
+#returns a (data, algorithm) pair per item, None for the entries that are bigger than BATCH_ENTRY or cant be read /
+#decrypted (those are decoded on their own, which raises the error)
+def decrypt_entries(reader, keys, pkg_type, items, key=0):
+    results = [None] * len(items)
+    batch = []
+    positions = []
+    for n, (file_sign, file_offset, file_length, file_original_length, zcrc, crc, zflag, file_flag) in enumerate(items):
+        if file_length > BATCH_ENTRY:
+            continue
+        data = reader.read(file_offset, file_length)
+        if len(data) != file_length:
+            continue
+        try:
+            decryption_algorithm(file_flag)
+            check_range(file_flag, file_length, key, crc, file_length, file_original_length)
+        except Exception:
+            continue
+        if pkg_type:
+            data = keys.decrypt(data)
+        batch.append((file_flag, data, crc, file_length, file_original_length))
+        positions.append(n)
+    for n, result in zip(positions, file_decrypt_batch(batch, key)):
+        results[n] = result
+    return results
+
+#big entries are decoded in chunks of this size, so they are never in memory all at once
+STREAM_CHUNK = 1 << 20
+
+#lz4 block data can only be decompressed all at once
+def can_stream(zflag):
+    return zflag in (0, 1, 3)
+
+#the entries bigger than stream_size bytes (compressed or not) are decoded a chunk at a time, 0 never streams
+def should_stream(stream_size, file_length, file_original_length, zflag):
+    return bool(stream_size) and max(file_length, file_original_length) > stream_size and can_stream(zflag)
+
+#file-like reader of the stored data of one entry with the EXPK XOR and the file flag decryption done,
+#read in order a chunk at a time
+class EntryReader:
+    def __init__(self, reader, keys, pkg_type, file_flag, crc, file_offset, file_length, file_original_length, key=0):
+        check_range(file_flag, file_length, key, crc, file_length, file_original_length)
+        self.reader = reader
+        self.keys = keys.stream() if pkg_type else None
+        self.pkg_type = pkg_type
+        self.decryption = (file_flag, key, crc, file_length, file_original_length)
+        self.file_offset = file_offset
+        self.file_length = file_length
+        self.position = 0
+
+    def read(self, size=-1):
+        if size < 0:
+            size = self.file_length - self.position
+        size = min(size, self.file_length - self.position)
+        if size <= 0:
+            return b''
+        data = self.reader.read(self.file_offset + self.position, size)
+        if len(data) != size:
+            raise Exception("TRUNCATED ENTRY: {} OF {} BYTES".format(self.position + len(data), self.file_length))
+        if self.pkg_type:
+            data = self.keys.decrypt(data, self.position)
+        file_flag, key, crc, file_length, file_original_length = self.decryption
+        data = file_decrypt_at(file_flag, data, self.position, key, crc, file_length, file_original_length)
+        self.position += size
+        return data
+
+    def seek(self, position):
+        self.position = position
+
+#decompressed data of an entry in chunks of at most chunk_size bytes (zflag has to be one can_stream accepts)
+def stream_entry(source, zflag, zstd_dict=None, chunk_size=STREAM_CHUNK):
+    if zflag == 1:
+        decompressor = zlib.decompressobj()
+        while not decompressor.eof:
+            data = decompressor.unconsumed_tail or source.read(chunk_size)
+            if not data:
+                raise Exception("INCOMPLETE ZLIB DATA")
+            chunk = decompressor.decompress(data, chunk_size)
+            if chunk:
+                yield chunk
+    elif zflag == 3:
+        with zstd_decompressor(zstd_dict).stream_reader(source, read_size=chunk_size) as reader:
+            while chunk := reader.read(chunk_size):
+                yield chunk
+    else:
+        while chunk := source.read(chunk_size):
+            yield chunk
+
+#compressed data is read this much at a time when only the start of an entry is decoded
+PEEK_CHUNK = 1 << 14
+#lz4 entries up to this many times the peeked size are decoded whole
+PEEK_WHOLE = 16
+
+#the first (at most) size bytes of the decompressed data of an entry, only as much as that needs is read and decoded
+def peek_entry(source, zflag, zstd_dict=None, size=STREAM_HEAD, file_original_length=0):
+    if zflag == 2:
+        #lz4.block is much faster than walking the sequences here, so entries that arent much bigger than size are
+        #decoded whole
+        if 0 < file_original_length <= PEEK_WHOLE * size:
+            return zflag_decompress(zflag, source.read(), file_original_length)[:size]
+        #an lz4 literal run of n bytes has n / 255 length bytes in front of it
+        return lz4_block_head(source.read(2 * size + file_original_length // 255 + 64), size)
+    parts = []
+    length = 0
+    chunks = stream_entry(source, zflag, zstd_dict, PEEK_CHUNK)
+    try:
+        for chunk in chunks:
+            parts.append(bytes(chunk[:size - length]))
+            length += len(parts[-1])
+            if length >= size:
+                break
+    finally:
+        chunks.close()
+    return b''.join(parts)
+
+#opens an NPK once (header, index and NXFN names) and decodes single entries when they are asked for
+#entries can be looked up by position, by NXFN name or by file sign
+#with cache the parsed header / index / names are kept in a sidecar file (see cache.py) for the next time
+#zstd_dict is the path of a zstd dictionary, without it the NPK is searched for one the first time the zstd_dict
+#attribute is used (so opening, listing and filtering never read entry data)
+#with fileobj the NPK is read from it instead of path (path is only its name then and there is no cache)
+class NpkArchive:
+    def __init__(self, path, use_mmap=True, keys=None, force=False, key=0, cache=False, zstd_dict=None, fileobj=None):
+        self.path = path
+        self.keys = keys if keys is not None else Keys()
+        self.key = key
+        self.owns_file = fileobj is None
+        self.f = fileobj if fileobj is not None else open(path, 'rb')
+        cache = cache and self.owns_file
+        self.reader = NpkReader(self.f, use_mmap)
+        self._by_name = None
+        self._by_sign = None
+        self._folders = None
+        try:
+            if not (cache and not force and self.load_cache()):
+                self.read_header(force)
+                self.read_names()
+                self.read_index()
+                if cache and not force:
+                    save_cache(path, {field: getattr(self, field) for field in HEADER_FIELDS}, self.index_data, self.names.blob)
+            self._zstd_dict = load_zstd_dict(zstd_dict) if zstd_dict else None
+            self._zstd_dict_found = bool(zstd_dict)
+            self._zstd_dict_lock = threading.Lock()
+        except Exception:
+            self.close()
+            raise
+
+    def read_header(self, force):
+        f = self.f
+        self.magic = None
+        self.pkg_type = None
+        if not force:
+            self.magic = f.read(4)
+            if self.magic == b'NXPK':
+                self.pkg_type = 0
+            elif self.magic == b'EXPK':
+                self.pkg_type = 1
+            else:
+                raise Exception('NOT NXPK/EXPK FILE')
+        self.header_offset = f.tell()
+        self.files = readuint32(f)
+        self.var1 = readuint32(f)
+        self.encryption_mode = readuint32(f)
+        self.hash_mode = readuint32(f)
+        self.index_offset = readuint32(f)
+        self.info_size = determine_info_size(f, self.var1, self.hash_mode, self.encryption_mode, self.index_offset, self.files)
+
+    #the NXFN table starts after the index with b"NXFN" + 12 bytes (unknown for now) and goes to the end of the file
+    def read_names(self):
+        self.names = NameTable()
+        if self.encryption_mode == 256:
+            self.names = NameTable(read_blob(self.f, self.index_offset + (self.files * self.info_size) + 16, file_size(self.f)))
+
+    def read_index(self):
+        data = self.reader.read(self.index_offset, self.files * self.info_size)
+        if self.pkg_type:
+            data = self.keys.decrypt(data)
+        self.index_data = data
+        self.index = decode_index(data, self.info_size, self.files)
+
+    def load_cache(self):
+        cached = load_cache(self.path)
+        if cached is None:
+            return False
+        header, self.index_data, names = cached
+        for field, value in header.items():
+            setattr(self, field, value)
+        self.magic = (b'NXPK', b'EXPK')[self.pkg_type]
+        self.names = NameTable(names)
+        self.index = decode_index(self.index_data, self.info_size, self.files)
+        return True
+
+    #start of an entry as stored (after the EXPK XOR, but before the file flag decryption)
+    def read_head(self, i, length):
+        data = self.reader.read(int(self.index['file_offset'][i]), min(length, int(self.index['file_length'][i])))
+        if self.pkg_type:
+            data = self.keys.decrypt(data)
+        return bytes(data)
+
+    #the raw zstd dictionary of the zstd entries (None if they dont use one), looked for once when first needed
+    @property
+    def zstd_dict(self):
+        if not self._zstd_dict_found:
+            with self._zstd_dict_lock:
+                if not self._zstd_dict_found:
+                    self._zstd_dict = self.find_zstd_dict()
+                    self._zstd_dict_found = True
+        return self._zstd_dict
+
+    #the zstd dictionary stored in the NPK as an uncompressed entry, only looked for when the first zstd frames
+    #say they were made with a dictionary (dictionary ID flag of the frame header descriptor)
+    def find_zstd_dict(self):
+        zstd_entries = np.flatnonzero((self.index['zflag'] == 3) & (self.index['file_flag'] == 0))[:16].tolist()
+        if not any(len(head) == 5 and head[4] & 3 for head in (self.read_head(i, 5) for i in zstd_entries)):
+            return None
+        for i in np.flatnonzero((self.index['zflag'] == 0) & (self.index['file_flag'] == 0) & (self.index['file_length'] > 8)).tolist():
+            if self.read_head(i, 4) == ZSTD_DICT_MAGIC:
+                return self.read_head(i, int(self.index['file_length'][i]))
+        return None
+
+    def name(self, i):
+        if i < len(self.names):
+            return self.names.path(i)
+        return None
+
+    #the folders of the NXFN names as a trie (see names.py), built the first time it is needed
+    def folders(self):
+        if self._folders is None:
+            self._folders = DirectoryTrie(self.names, self.files)
+        return self._folders
+
+    #(subfolder names, positions of the entries right in the folder) of an NXFN folder ("" is the root)
+    def listdir(self, folder=''):
+        return self.folders().listdir(folder)
+
+    #number of entries under an NXFN folder
+    def count(self, folder=''):
+        return self.folders().count(folder)
+
+    def entry(self, i):
+        if not 0 <= i < self.files:
+            raise IndexError("ENTRY {} OUT OF RANGE (0 TO {})".format(i, self.files - 1))
+        return NpkEntry(i, *(self.index[field][i].item() for field in INDEX_FIELDS), self.name(i))
+
+    def find(self, name):
+        if self._by_name is None:
+            self._by_name = {self.name(i): i for i in range(min(len(self.names), self.files))}
+        return self.entry(self._by_name[name.replace("\\", "/")])
+
+    def find_sign(self, file_sign):
+        if self._by_sign is None:
+            self._by_sign = {sign: i for i, sign in enumerate(self.index['file_sign'].tolist())}
+        return self.entry(self._by_sign[file_sign])
+
+    #positions of the entries that pass the filters, only the index and the NXFN names are looked at
+    #include / exclude are globs on the NXFN path (like "*.mesh" or "char/hero/*"), signs is a list of file signs
+    #and folders a list of NXFN folders (the entries under any of them are kept)
+    def select(self, include=None, exclude=None, signs=None, folders=None):
+        mask = np.ones(self.files, dtype=bool)
+        if signs:
+            mask &= np.isin(self.index['file_sign'], signs)
+        if folders:
+            under = np.zeros(self.files, dtype=bool)
+            for folder in folders:
+                if self.folders().find(folder) is not None:
+                    under[self.folders().under(folder)] = True
+            mask &= under
+        include, exclude = compile_globs(include), compile_globs(exclude)
+        if include or exclude:
+            for i in np.flatnonzero(mask).tolist():
+                name = self.name(i)
+                if include and (name is None or not include.match(name)):
+                    mask[i] = False
+                elif exclude and name is not None and exclude.match(name):
+                    mask[i] = False
+        return np.flatnonzero(mask)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.find(key)
+        return self.entry(key)
+
+    def __len__(self):
+        return self.files
+
+    def __iter__(self):
+        for i in range(self.files):
+            yield self.entry(i)
+
+    #the bytes of an entry as they are stored in the NPK
+    def read_raw(self, key):
+        entry = key if isinstance(key, NpkEntry) else self[key]
+        return self.reader.read(entry.file_offset, entry.file_length)
+
+    #the fully decoded bytes of an entry
+    def read(self, key):
+        entry = key if isinstance(key, NpkEntry) else self[key]
+        data, compression = decode_entry(self.read_raw(entry), self.keys, self.pkg_type, entry.file_flag, entry.zflag,
+                                         entry.crc, entry.file_length, entry.file_original_length, self.key, self.zstd_dict)
+        return bytes(data)
+
+    #the start of the decoded bytes of an entry, without decoding the rest of it
+    def peek(self, key, size=STREAM_HEAD):
+        entry = key if isinstance(key, NpkEntry) else self[key]
+        return peek_entry(self.entry_reader(entry), entry.zflag, self.zstd_dict, size, entry.file_original_length)
+
+    #EntryReader of the stored data of an entry
+    def entry_reader(self, entry):
+        return EntryReader(self.reader, self.keys, self.pkg_type, entry.file_flag, entry.crc, entry.file_offset, entry.file_length, entry.file_original_length, self.key)
+
+    #the type (extension) the entry gets when it is extracted, found from its first size bytes like the streamed
+    #entries (so text patterns after them are not seen), rotor / NXS3 entries are decoded whole since their start
+    #depends on all of the data
+    #the end of a compressed entry is only known when it fits in size, so the types found from the end of a file
+    #(the TGA footer) are only looked for in those and in stored entries
+    def peek_type(self, key, size=STREAM_HEAD):
+        entry = key if isinstance(key, NpkEntry) else self[key]
+        head = self.peek(entry, size)
+        if get_compression(head) in ('rot', 'nxs3'):
+            data = self.read(entry)
+            return container_type(data) or get_ext(data)
+        if len(head) < size or len(head) >= entry.file_original_length:
+            return container_type(head) or get_ext(head)
+        tail = None
+        if entry.zflag == 0:
+            source = self.entry_reader(entry)
+            source.seek(entry.file_length - 18)
+            tail = bytes(source.read(18))
+        return container_type(head) or get_stream_ext(head, tail, entry.file_original_length)
+
+    #peek_type of the selected entries (an object array in the same order), None for the ones that cant be decoded
+    def peek_types(self, selected, jobs=1):
+        def peek(i):
+            try:
+                return self.peek_type(i)
+            except Exception:
+                return None
+        if jobs > 1:
+            with ThreadPoolExecutor(jobs) as pool:
+                types = list(pool.map(peek, selected.tolist()))
+        else:
+            types = [peek(i) for i in selected.tolist()]
+        peeked = np.empty(len(types), dtype=object)
+        peeked[:] = types
+        return peeked
+
+    def close(self):
+        self.reader.close()
+        if self.owns_file:
+            self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
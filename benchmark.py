@@ -0,0 +1,308 @@
+import os, zlib, random, argparse
+from timeit import default_timer as timer
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.backends import default_backend
+import decompression, rotor, detection
+
+#micro-benchmarks of the decoding hot paths, every one compares the old way against the current one
+#on generated data and checks that both give the same result
+
+def measure(func, data, repeat):
+    start = timer()
+    for _ in range(repeat):
+        result = func(data)
+    return timer() - start, result
+
+def report(name, size, repeat, old, new):
+    mb = size * repeat / 1048576
+    print(f"{name}: OLD {mb / old:.2f} MB/s, NEW {mb / new:.2f} MB/s ({old / new:.1f}x)")
+
+#the rot path as it was: a new AES encryptor for every entry and the unscramble done on a python list
+def old_rot(data):
+    rotor = decompression.init_rotor()
+    l = list(zlib.decompress(rotor.update(data)))
+    l = list(map(lambda x: x ^ 154, l[0:128])) + l[128:]
+    l.reverse()
+    return bytes(l)
+
+def new_rot(data):
+    return decompression.special_decompress("rot", data)
+
+#makes a rot entry out of plain data, by doing the decoding steps backwards
+def make_rot(plain):
+    scrambled = bytes(x ^ 154 if i < 128 else x for i, x in enumerate(plain[::-1]))
+    compressed = zlib.compress(scrambled)
+    compressed += bytes(-len(compressed) % 16)
+    decryptor = Cipher(algorithms.AES(b'sixteen byte key'), modes.ECB(), backend=default_backend()).decryptor()
+    return decryptor.update(compressed)
+
+def bench_rot(size, count, repeat):
+    #script bundles: many small entries plus a few big ones
+    plains = [os.urandom(size // 4) * 4 for _ in range(count)]
+    entries = [make_rot(plain) for plain in plains]
+    total = sum(len(plain) for plain in plains)
+    old, old_result = measure(lambda entries: [old_rot(entry) for entry in entries], entries, repeat)
+    new, new_result = measure(lambda entries: [new_rot(entry) for entry in entries], entries, repeat)
+    if old_result != plains or [bytes(data) for data in new_result] != plains:
+        raise Exception("ROT RESULTS DONT MATCH")
+    report(f"ROT ({count} x {size} BYTES)", total, repeat, old, new)
+
+#rotor.newrotor as it was: every byte walks every rotor in python and is appended to a new bytes object
+def old_rotor_decrypt(r, buf):
+    r.positions[1] = None
+    size, nr, rotors, pos = r.get_rotors(1)
+    outbuf = b''
+    for c in buf:
+        for i in range(nr-1,-1,-1):
+            c = pos[i] ^ rotors[i][c]
+        outbuf = outbuf + c.to_bytes(1, "big")
+        pnew = 0
+        for i in range(nr):
+            pnew = ((pos[i] + (pnew >= size)) & 0xff) + rotors[i][size]
+            pos[i] = pnew % size
+    return outbuf
+
+def bench_rotor(size, count, repeat):
+    #one script blob of size bytes, the old engine is quadratic so it only gets a tenth of it
+    data = os.urandom(size)
+    small = data[:max(size // 10, 1)]
+    old, old_result = measure(lambda data: old_rotor_decrypt(rotor.newrotor('benchmark key'), data), small, repeat)
+    new, new_result = measure(lambda data: rotor.newrotor('benchmark key').decrypt(data), data, repeat)
+    if bytes(new_result[:len(small)]) != old_result:
+        raise Exception("ROTOR RESULTS DONT MATCH")
+    mb = repeat / 1048576
+    print(f"ROTOR ({size} BYTES): OLD {len(small) * mb / old:.2f} MB/s, NEW {size * mb / new:.2f} MB/s")
+
+#the text part of detection.get_ext as it was: one substring search over the whole data per pattern
+def old_text_ext(data):
+    data = bytes(data)
+    #NeoXML file detection
+    if b'Type="Animation"' in data:
+        return 'animation'
+    if b'<AnimationConfig' in data:
+        return 'animconfig'
+    if b'<AnimationGraph' in data:
+        return 'animgraph'
+    if b'<Physics' in data:
+        return 'col'
+    if b'<EnvParticle' in data:
+        return 'envp'
+    if b'<MaterialGroup' in data:
+        return 'mtg'
+    if b'<Material' in data:
+        return 'mtl'
+    if b'<Chain' in data:  #needs more testing
+        return 'physicalbone'
+    if b'<PostProcess' in data:
+        return 'postprocess'
+    if b'DisableBakeLightProbe=' in data:  #needs more testing
+        return 'prefab'
+    if b'<FxGroup' in data:
+        return 'sfx'
+    if b'<MapSkeletonToMeshBone' in data:
+        return 'skeletonextra'
+    if b'<Macros' in data:
+        return 'xml.template'
+    if b'<Head Type="Timeline"' in data:
+        return 'timeline'
+    if b'<MetaInfo' in data:
+        return 'pvr.meta'
+    if b'precision mediump' in data:
+        return 'ps'
+    if b'POSITION' in data:
+        return 'vs'
+    if b'technique' in data:
+        return 'nfx'
+    if b'package google.protobuf' in data:
+        return 'proto'
+    if b'#ifndef' in data:
+        return 'h'
+    if b'#include <google/protobuf' in data:
+        return "cc"
+    if b'void' in data or b'main(' in data or b'include' in data or b'float' in data:
+        return 'shader'
+    if b'technique' in data or b'ifndef' in data:
+        return 'shader'
+    if b'?xml' in data:
+        return 'xml'
+    if b'<script' in data:
+        return 'html'
+    if b'Javascript' in data:
+        return 'js'
+    if b'biped' in data or b'bip001' in data or b'bone' in data or b'bone001' in data or b'bip01' in data:
+        return 'bip'
+    if b'div.document' in data:
+        return 'css'
+    return None
+
+#data that hits every pattern alone, in pairs (both orders, apart and touching), and pieces of patterns
+#glued together (overlapping and partial matches), inside random binary or text filler
+def ext_corpus(size, count):
+    rng = random.Random(1)
+    patterns = list(detection.TEXT_RANKS)
+    filler = lambda: rng.choice([os.urandom, lambda n: bytes(rng.choice(b' abcdefgh<>=#.\n') for _ in range(n))])(rng.randint(0, size))
+    corpus = [b'', b'x' * size, os.urandom(size)]
+    for pattern in patterns:
+        corpus += [pattern, filler() + pattern + filler(), pattern[:-1], pattern[1:]]
+    for _ in range(count):
+        first, second = rng.choice(patterns), rng.choice(patterns)
+        corpus += [filler() + first + filler() + second + filler(), first + second, first[:-1] + second, second + first[1:]]
+        corpus.append(b''.join(rng.choice(patterns)[rng.randint(0, 4):] for _ in range(rng.randint(2, 12))))
+    return corpus
+
+#every file under a folder (extracted files, for a real corpus)
+def folder_corpus(folder):
+    for root, dirs, files in os.walk(folder):
+        for name in sorted(files):
+            with open(os.path.join(root, name), 'rb') as f:
+                yield f.read()
+
+def bench_ext(size, count, repeat, corpus=None):
+    #the types themselves are checked by check_detection.py
+    samples = list(folder_corpus(corpus)) if corpus else ext_corpus(size, count)
+    #the worst case, big files where nothing matches (every old search goes through all of it)
+    blobs = [os.urandom(8 << 20), b'\x00 some text without markers ' * 300000]
+    old, _ = measure(lambda blobs: [old_text_ext(blob) for blob in blobs], blobs, repeat)
+    new, _ = measure(lambda blobs: [detection.get_text_ext(blob, None) for blob in blobs], blobs, repeat)
+    report("EXT (NO MATCH, WHOLE DATA)", sum(len(blob) for blob in blobs), repeat, old, new)
+    new, _ = measure(lambda blobs: [detection.get_text_ext(blob) for blob in blobs], blobs, repeat)
+    report("EXT (NO MATCH, FIRST {} BYTES)".format(detection.TEXT_WINDOW), sum(len(blob) for blob in blobs), repeat, old, new)
+    old, _ = measure(lambda samples: [old_text_ext(data) for data in samples], samples, repeat)
+    new, _ = measure(lambda samples: [detection.get_text_ext(data) for data in samples], samples, repeat)
+    report("EXT (CORPUS)", sum(len(data) for data in samples), repeat, old, new)
+
+#detection.get_magic_ext as it was: an elif chain that tries every magic in turn (coc, pyi and pem with the slice
+#lengths fixed, they were one byte shorter or longer than the magic and could never match)
+def old_magic_ext(data):
+    if len(data) == 0:
+        return 'empty'
+    elif data[:4] == bytes([0xE3, 0x00, 0x00, 0x00]) or data[:4] == bytes([0x63, 0x00, 0x00, 0x00]) or data[2:4] == bytes([0x0D, 0x0A]):
+        return 'pyc'
+    elif data[:14] == b'CocosStudio-UI':
+        return 'coc'
+    elif data[:8] == b'SKELETON':
+        return 'skeleton'
+    elif data[:3] == b'hit':
+        return 'hit'
+    elif data[:3] == b'PKM':
+        return 'pkm'
+    elif data[:3] == b'PVR':
+        return 'pvr'
+    elif data[:3] == b'DDS':
+        return 'dds'
+    elif data[-18:-2] == b'TRUEVISION-XFILE' or data[:3] == bytes([0x00, 0x00, 0x02]) or data[:3] == bytes([0x0D, 0x00, 0x02]):
+        return 'tga'
+    elif data [:2] == b'BM':
+        return 'bmp'
+    elif data[:19] == b'from typing import ':
+        return 'pyi'
+    elif data[1:4] == b'KTX':
+        return 'ktx'
+    elif data[1:4] == b'PNG':
+        return 'png'
+    elif data[:4] == bytes([0x34, 0x80, 0xC8, 0xBB]):
+        return 'mesh'
+    elif data[:4] == bytes([0x14, 0x00, 0x00, 0x00]):
+        return 'type1'
+    elif data[:4] == bytes([0x04, 0x00, 0x00, 0x00]):
+        return 'type2'
+    elif data[:4] == bytes([0x00, 0x01, 0x00, 0x00]):
+        return 'type3'
+    elif data[1:8] == bytes([0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00]):
+        return 'blasttool'
+    elif data[:4] == b'VANT':
+        return 'vant'
+    elif data[:4] == b'MDMP':
+        return 'mdmp'
+    elif data[:4] == b'RGIS':
+        return 'gis'
+    elif data[:4] == b'NTRK':
+        return 'ntrk'
+    elif data[:4] == b'RIFF':
+        return 'riff'
+    elif data[:4] == bytes([0xFF,0xD8,0xFF,0xE1]):
+        return 'jpg'
+    elif data[:4] == b'BKHD':
+        return 'bnk'
+    elif data[:26] == b'-----BEING PUBLIC KEY-----':
+        return 'pem'
+    elif data[:1] == b'%':
+        return 'tpl'
+    elif data[:1] == b'{':
+        return 'json'
+    elif data[:4] == b'TZif':
+        return 'tzif'
+    elif data[6:10] == b'JFIF':
+        return 'jfif'
+    elif data[4:8] == b'ftyp':
+        return 'mp4'
+    elif data[:33] == b'NVidia(r) GameWorks Blast(tm) v.1':
+        return 'blast'
+    elif data[:8] == b'RAWANIMA':
+        return 'rawanimation'
+    elif data[:9] == b'blastmesh':
+        return 'blastmesh'
+    return None
+
+#headers that start (or end) with every registered magic, with every magic cut short by a byte, and random ones
+def magic_corpus(size, count):
+    rng = random.Random(2)
+    rules = [rule for rule in detection.FILE_TYPES.rules]
+    corpus = [os.urandom(rng.randint(0, 64)) for _ in range(count)]
+    for _, _, offset, magic, _ in rules:
+        for cut in (0, 1):
+            piece = magic[:len(magic) - cut]
+            filler = os.urandom(rng.randint(0, 64))
+            if offset < 0:
+                corpus.append(filler + piece + os.urandom(-offset - len(magic)))
+            else:
+                corpus.append(os.urandom(offset) + piece + filler)
+                corpus.append(bytes(offset) + piece)
+    return corpus
+
+#the first 64 and last 18 bytes of every file, like the detector sees a streamed entry
+def header_corpus(folder):
+    for data in folder_corpus(folder):
+        yield data[:64] + data[-18:] if len(data) > 82 else data
+
+#rules at negative offsets, one of them ends right at the end of the data
+def check_tail_magic():
+    registry = detection.MagicRegistry([(-4, b'TAIL', 'tail', 0), (-8, b'MID', 'mid', 1)])
+    for data, expected in ((b'xxxxTAIL', 'tail'), (b'TAIL', 'tail'), (b'xxxxTAILx', None), (b'AIL', None), (b'xMIDxxxxx', 'mid'), (b'MIDxxxxx', 'mid')):
+        if registry.match(data) != expected:
+            raise Exception("TAIL MAGIC DOESNT MATCH: {} INSTEAD OF {} ({!r})".format(registry.match(data), expected, data))
+
+def bench_magic(size, count, repeat, corpus=None):
+    check_tail_magic()
+    samples = list(header_corpus(corpus)) if corpus else magic_corpus(size, count)
+    found = {}
+    for data in samples:
+        expected = old_magic_ext(data)
+        if detection.get_magic_ext(data) != expected:
+            raise Exception("MAGIC TYPE DOESNT MATCH: {} INSTEAD OF {} ({!r})".format(detection.get_magic_ext(data), expected, data[:64]))
+        found[expected] = found.get(expected, 0) + 1
+    print(f"MAGIC: {len(samples)} HEADERS GIVE THE SAME TYPES ({len(found)} TYPES)")
+    old, _ = measure(lambda samples: [old_magic_ext(data) for data in samples], samples, repeat * 20)
+    new, _ = measure(lambda samples: [detection.get_magic_ext(data) for data in samples], samples, repeat * 20)
+    print(f"MAGIC ({len(samples)} HEADERS): OLD {old * 1e9 / (len(samples) * repeat * 20):.0f} NS, NEW {new * 1e9 / (len(samples) * repeat * 20):.0f} NS PER HEADER ({old / new:.1f}x)")
+
+BENCHMARKS = {'rot': bench_rot, 'rotor': bench_rotor, 'ext': bench_ext, 'magic': bench_magic}
+
+def main():
+    parser = argparse.ArgumentParser(description='Decoding micro-benchmarks')
+    parser.add_argument('names', nargs='*', help="Benchmarks to run: {} (all of them by default)".format(", ".join(BENCHMARKS)))
+    parser.add_argument('--size', type=int, default=65536, help="Size in bytes of every generated entry")
+    parser.add_argument('--count', type=int, default=200, help="Number of generated entries")
+    parser.add_argument('--repeat', type=int, default=3, help="Times every benchmark is repeated")
+    parser.add_argument('--corpus', help="Folder of real files (for example an extracted NPK) used by ext and magic instead of generated data")
+    opt = parser.parse_args()
+    for name in opt.names or BENCHMARKS:
+        if name not in BENCHMARKS:
+            raise Exception("UNKNOWN BENCHMARK: {}".format(name))
+        if name in ('ext', 'magic'):
+            BENCHMARKS[name](opt.size, opt.count, opt.repeat, opt.corpus)
+        else:
+            BENCHMARKS[name](opt.size, opt.count, opt.repeat)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+import os, mmap, struct
+
+#sidecar file written next to the NPK with everything that is parsed when opening it:
+#the header values, the (EXPK decrypted) index table and the NXFN name table
+#it is only used while the NPK has the same path, size and modification time it had when the cache was written
+CACHE_EXT = ".npkidx"
+CACHE_MAGIC = b'NPKC'
+CACHE_VERSION = 1
+
+HEADER_FIELDS = ('pkg_type', 'header_offset', 'files', 'var1', 'encryption_mode', 'hash_mode', 'index_offset', 'info_size')
+HEADER_FORMAT = '<iIIIIIII'
+
+def cache_path(path):
+    return path + CACHE_EXT
+
+def archive_key(path):
+    stat = os.stat(path)
+    return os.path.abspath(path).encode(), stat.st_size, stat.st_mtime_ns
+
+#returns (header dict, index table bytes, name blob) from the cache, or None if there is no valid cache
+#the index table and the name blob are copied out of the mapped cache file, which is closed before returning
+def load_cache(path):
+    try:
+        with open(cache_path(path), 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    view = memoryview(buf)
+    try:
+        magic, version, size, mtime, path_length = struct.unpack_from('<4sIQQH', view, 0)
+        pos = struct.calcsize('<4sIQQH')
+        key_path = bytes(view[pos:pos + path_length])
+        pos += path_length
+        if magic != CACHE_MAGIC or version != CACHE_VERSION or (key_path, size, mtime) != archive_key(path):
+            return None
+        header = dict(zip(HEADER_FIELDS, struct.unpack_from(HEADER_FORMAT, view, pos)))
+        pos += struct.calcsize(HEADER_FORMAT)
+        if header['pkg_type'] < 0:
+            header['pkg_type'] = None
+        names_length, = struct.unpack_from('<Q', view, pos)
+        pos += 8
+        index_length = header['files'] * header['info_size']
+        table = bytes(view[pos:pos + index_length])
+        names = bytes(view[pos + index_length:pos + index_length + names_length])
+        if len(table) != index_length or len(names) != names_length:
+            return None
+        return header, table, names
+    except (struct.error, OSError):
+        return None
+    finally:
+        view.release()
+        buf.close()
+
+#writes the cache, silently does nothing if the folder of the NPK is read only
+def save_cache(path, header, table, names):
+    key_path, size, mtime = archive_key(path)
+    values = [header[field] for field in HEADER_FIELDS]
+    if values[0] is None:
+        values[0] = -1
+    file_path = cache_path(path)
+    try:
+        with open(file_path + ".tmp", 'wb') as f:
+            f.write(struct.pack('<4sIQQH', CACHE_MAGIC, CACHE_VERSION, size, mtime, len(key_path)))
+            f.write(key_path)
+            f.write(struct.pack(HEADER_FORMAT, *values))
+            f.write(struct.pack('<Q', len(names)))
+            f.write(table)
+            f.write(names)
+        os.replace(file_path + ".tmp", file_path)
+    except OSError:
+        pass
@@ -0,0 +1,38 @@
+import sys, argparse
+import detection
+from benchmark import old_text_ext, ext_corpus, folder_corpus, check_tail_magic
+
+#checks that the text type detection gives the same types as the old substring searches (benchmark.old_text_ext)
+#on generated data or on a folder of real files, every difference is printed and the exit code is 1 if there are any
+
+def check_ext(samples):
+    failed = 0
+    for data in samples:
+        expected = old_text_ext(data)
+        found = detection.get_text_ext(data, None)
+        if found != expected:
+            failed += 1
+            print("TEXT TYPE DOESNT MATCH: {} INSTEAD OF {} ({!r})".format(found, expected, bytes(data[:64])))
+        elif len(data) <= detection.TEXT_WINDOW and detection.get_text_ext(data) != expected:
+            failed += 1
+            print("TEXT TYPE DOESNT MATCH IN THE WINDOW: {} INSTEAD OF {} ({!r})".format(detection.get_text_ext(data), expected, bytes(data[:64])))
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description='File type detection checks')
+    parser.add_argument('--size', type=int, default=65536, help="Size in bytes of the generated filler")
+    parser.add_argument('--count', type=int, default=200, help="Number of generated pattern pairs")
+    parser.add_argument('--corpus', help="Folder of real files (for example an extracted NPK) used instead of generated data")
+    opt = parser.parse_args()
+    samples = list(folder_corpus(opt.corpus)) if opt.corpus else ext_corpus(opt.size, opt.count)
+    failed = check_ext(samples)
+    print(f"EXT: {len(samples) - failed} OF {len(samples)} SAMPLES GIVE THE SAME TYPES")
+    try:
+        check_tail_magic()
+    except Exception as e:
+        failed += 1
+        print(e)
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
-import ctypes, zlib, zstandard, lz4.block, zipfile, os, platform
+import ctypes, zlib, zstandard, lz4.block, zipfile, os, array, threading, re
+import numpy as np
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.backends import default_backend
 
@@ -19,61 +20,150 @@ def init_rotor():
     encryptor = cipher.encryptor()
     return encryptor
 
+#every thread keeps one rotor, ECB has no state between blocks so it can be reused as long as it is
+#only given whole blocks (a new rotor would drop the trailing partial block too)
+_rotors = threading.local()
+
+def thread_rotor():
+    rotor = getattr(_rotors, 'rotor', None)
+    if rotor is None:
+        rotor = _rotors.rotor = init_rotor()
+    return rotor
+
+def rot_decrypt(data):
+    return thread_rotor().update(data[:len(data) // 16 * 16])
+
+ROT_XOR_TABLE = bytes(x ^ 154 for x in range(256))
+
 def _reverse_string(s):
-    l = list(s)
-    l = list(map(lambda x: x ^ 154, l[0:128])) + l[128:]
-    l.reverse()
-    return bytes(l)
+    return (bytes(s[:128]).translate(ROT_XOR_TABLE) + s[128:])[::-1]
 
-def nxs_unpack(data):
-    print(f"Operating System: {platform.system()}")
-    print(f"Architecture: {platform.architecture()}")
+#libpubdecrypt (RSA public decrypt of the NXS3 key block) is loaded once, from the dll folder next to this file
+NXS3_LIBRARY = {"posix": "libpubdecrypt.so", "nt": "libpubdecrypt.dll"}
+NXS3_KEY_BLOCK = 128
+_nxs3_lib = None
+_nxs3_lock = threading.Lock()
 
-    wrapped_key = ctypes.create_string_buffer(4)
-    data_in = ctypes.create_string_buffer(data[20:])
-
-    if os.name == "posix":
-        try:
-            liblinux = ctypes.CDLL("./dll/libpubdecrypt.so")
-        except OSError as e:
-            raise Exception(f"Error loading DLL on POSIX system: {e}")
-        returning = liblinux.public_decrypt(data_in, wrapped_key)
-    elif os.name == "nt":
-        try:
-            libwindows = ctypes.CDLL('./dll/libpubdecrypt.dll')
-        except OSError as e:
-            raise Exception(f"Error loading DLL on Windows: {e}")
-        returning = libwindows.public_decrypt(data_in, wrapped_key)
-    else:
-        raise Exception("Unsupported operating system.")
+def nxs3_library():
+    global _nxs3_lib
+    with _nxs3_lock:
+        if _nxs3_lib is None:
+            if os.name not in NXS3_LIBRARY:
+                raise Exception("Unsupported operating system.")
+            try:
+                _nxs3_lib = ctypes.CDLL(os.path.join(os.path.dirname(os.path.abspath(__file__)), "dll", NXS3_LIBRARY[os.name]))
+            except OSError as e:
+                raise Exception(f"Error loading DLL ({os.name}): {e}")
+        return _nxs3_lib
 
+#one 32 bit word of the NXS3 keystream for every 4 bytes of payload (little endian), each word comes from the last one
+#(rotate right by 19, times 5, + 0xE6546B64)
+def nxs3_keystream(ephemeral_key, words):
+    keystream = array.array('I', bytes(4 * words))
+    for i in range(words):
+        keystream[i] = ephemeral_key
+        ror = (ephemeral_key >> 19) | ((ephemeral_key << (32 - 19)) & 0xFFFFFFFF)
+        ephemeral_key = (ror * 5 + 0xE6546B64) & 0xFFFFFFFF
+    return np.frombuffer(keystream, dtype=np.uint32)
+
+#safe to call from several threads, only the native RSA call is done one at a time
+def nxs_unpack(data):
+    lib = nxs3_library()
+    wrapped_key = ctypes.create_string_buffer(4)
+    key_block = ctypes.create_string_buffer(bytes(data[20:20 + NXS3_KEY_BLOCK]), NXS3_KEY_BLOCK)
+    with _nxs3_lock:
+        lib.public_decrypt(key_block, wrapped_key)
     ephemeral_key = int.from_bytes(wrapped_key.raw, "little")
 
-    decrypted = []
+    payload = data[20 + NXS3_KEY_BLOCK:]
+    size = len(payload)
+    words = (size + 3) // 4
+    decrypted = bytearray(4 * words)
+    decrypted[:size] = payload
+    buf = np.frombuffer(decrypted, dtype='<u4')
+    np.bitwise_xor(buf, nxs3_keystream(ephemeral_key, words), out=buf)
+    del buf
+    del decrypted[size:]
+    return decrypted
+
+#decompression contexts are kept per thread and reused, zstd ones per dictionary (raw bytes of a zstd dictionary)
+ZSTD_DICT_MAGIC = b'\x37\xA4\x30\xEC'
+_contexts = threading.local()
 
-    for i, x in enumerate(data[20 + 128:]):
-        val = x ^ ((ephemeral_key >> (i % 4 * 8)) & 0xff)
-        if i % 4 == 3:
-            ror = (ephemeral_key >> 19) | ((ephemeral_key << (32 - 19)) & 0xFFFFFFFF)
-            ephemeral_key = (ror + ((ror << 2) & 0xFFFFFFFF) + 0xE6546B64) & 0xFFFFFFFF
-        decrypted.append(val)
+def zstd_decompressor(dictionary=None):
+    decompressors = getattr(_contexts, 'zstd', None)
+    if decompressors is None:
+        decompressors = _contexts.zstd = {}
+    decompressor = decompressors.get(dictionary)
+    if decompressor is None:
+        if dictionary is None:
+            decompressor = zstandard.ZstdDecompressor()
+        else:
+            decompressor = zstandard.ZstdDecompressor(dict_data=zstandard.ZstdCompressionDict(dictionary))
+        decompressors[dictionary] = decompressor
+    return decompressor
 
-    decrypted = bytes(decrypted)
-    return decrypted
+def load_zstd_dict(path):
+    with open(path, 'rb') as f:
+        dictionary = f.read()
+    if dictionary[:4] != ZSTD_DICT_MAGIC:
+        raise Exception("NOT A ZSTD DICTIONARY: {}".format(path))
+    return dictionary
 
-def zflag_decompress(flag, data, origlength=0):
+#origlength is the size of the decompressed data (file_original_length), the output is allocated once at that size
+def zflag_decompress(flag, data, origlength=0, dictionary=None):
     if flag == 1:
-        return zlib.decompress(data, bufsize=origlength)
+        return zlib.decompress(data, bufsize=origlength or zlib.DEF_BUF_SIZE)
     elif flag == 2:
         return lz4.block.decompress(data, uncompressed_size=origlength)
     elif flag == 3:
-        return zstandard.ZstdDecompressor().decompress(data)
+        return zstd_decompressor(dictionary).decompress(data, max_output_size=origlength)
     return data
 
+#a length of 15 goes on in the next bytes: 255 for every byte that is 255 and then the first one that isnt
+_LZ4_LENGTH_RUN = re.compile(rb'\xff*')
+
+def _lz4_length(data, position, length):
+    run = _LZ4_LENGTH_RUN.match(data, position).end()
+    length += 255 * (run - position)
+    if run < len(data):
+        return length + data[run], run + 1
+    return length, run
+
+#the first (at most) size bytes of an lz4 block, data can be just the start of the block
+#lz4.block only decompresses whole blocks, so the sequences (literals + match copy) are walked here until size is reached
+def lz4_block_head(data, size):
+    data = bytes(data)
+    out = bytearray()
+    position = 0
+    end = len(data)
+    while position < end and len(out) < size:
+        token = data[position]
+        position += 1
+        literals = token >> 4
+        if literals == 15:
+            literals, position = _lz4_length(data, position, literals)
+        out += data[position:position + literals]
+        position += literals
+        if position + 2 > end or len(out) >= size:
+            break
+        offset = data[position] | data[position + 1] << 8
+        position += 2
+        length = token & 15
+        if length == 15:
+            length, position = _lz4_length(data, position, length)
+        length += 4
+        if offset == 0 or offset > len(out):
+            raise Exception("CORRUPT LZ4 DATA: MATCH OFFSET {} AT {}".format(offset, len(out)))
+        #the match can overlap what it writes, then it repeats the last offset bytes (nothing past size is needed)
+        length = min(length, size - len(out))
+        match = out[len(out) - offset:len(out) - offset + length]
+        out += (match * (length // len(match) + 1))[:length]
+    return bytes(out[:size])
+
 def special_decompress(flag, data):
     if flag == "rot":
-        rotor = init_rotor()
-        return _reverse_string(zlib.decompress(rotor.update(data)))
+        return _reverse_string(zlib.decompress(rot_decrypt(data)))
     elif flag == "nxs3":
         buf = nxs_unpack(data)
         return lz4.block.decompress(buf, int.from_bytes(data[16:20], "little"))
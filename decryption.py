@@ -1,3 +1,5 @@
+import numpy as np
+
 def decryption_algorithm(flag):
     match flag:
         case 0:
@@ -12,65 +14,104 @@ def decryption_algorithm(flag):
             return "XOR_32_127_TYPE3"
     raise Exception("ERROR IN DECRYPTION ALGORITHM: VALUE {}".format(flag))
 
-def file_decrypt(flag, data, key=0,crc=0,file_length=0,file_original_length=0):
+#every flag XORs one range of the data with an incrementing byte (base, base + 1, ...), KEY_RAMP[base:base + size]
+#is that key for any base, so the key tables are never rebuilt (size is never over 0x100)
+KEY_RAMP = np.arange(0x200, dtype=np.uint16).astype(np.uint8)
+
+#start, size and first key byte of the range that flag encrypts, None for flag 0
+def decrypt_range(flag, key=0, crc=0, file_length=0, file_original_length=0):
     match flag:
         case 1:
-            size = file_length
-
-            if size > 0x80:
-                size = 0x80
-
-            key = [(key + x) & 0xFF for x in range(0, 0x100)]
             #key1: 150 + x   (Onmyoji, Onmyoji RPG)
-            #key2:  -250 + x 
-            data = bytearray(data)
-            for j in range(size):
-                data[j] = data[j] ^ key[j % 0xff]
-            
-        case 2:
-            b = crc ^ file_original_length
-
+            #key2:  -250 + x
+            return 0, min(file_length, 0x80), key & 0xFF
+        case 2 | 3:
             start = 0
             size = file_length
-
             if size > 0x80:
                 start = (crc >> 1) % (file_length - 0x80)
                 size = 2 * file_original_length % 0x60 + 0x20
+            return start, size, (crc ^ file_original_length) & 0xFF
+        case 4:
+            offset = 0
+            length = file_length
+            if file_length >= 0x80:
+                offset = (file_original_length >> 1) % (file_length - 0x80)
+                length = ((crc << 1) & 0xffffffff) % 0x60 + 0x20
+            return offset, max(min(offset + length, file_original_length) - offset, 0), (file_original_length ^ crc) & 0xff
+    return None
 
-            key = [(x + b) & 0xFF for x in range(0, 0x81)]
-            for j in range(size):
-                data[start + j] = data[start + j] ^ key[j % 0x80]
-        case 3:
-            b = crc ^ file_original_length
+#the data as a writable uint8 array, bytearrays and writable memoryviews are changed in place, anything else is copied
+def writable(data):
+    if isinstance(data, bytearray) or (isinstance(data, memoryview) and not data.readonly):
+        return data
+    return bytearray(data)
 
-            start = 0
-            size = file_length
-            if size > 0x80:
-                start = (crc >> 1) % (file_length - 0x80)
-                size = 2 * file_original_length % 0x60 + 0x20
-            
-            key = [(x + b) & 0xFF for x in range(0, 0x81)]
-            data = bytearray(data)
-            for j in range(size):
-                data[start + j] = data[start + j] ^ key[j % 0x80]
-        case 4:
-            v3 = int(file_original_length)
-            v4 = int(crc)
+def file_decrypt(flag, data, key=0,crc=0,file_length=0,file_original_length=0):
+    xor_range = decrypt_range(flag, key, crc, file_length, file_original_length)
+    if xor_range is None or xor_range[1] <= 0:
+        return data
+    check_range(flag, len(data), key, crc, file_length, file_original_length)
+    start, size, base = xor_range
+    data = writable(data)
+    buf = np.frombuffer(data, dtype=np.uint8)
+    np.bitwise_xor(buf[start:start + size], KEY_RAMP[base:base + size], out=buf[start:start + size])
+    return data
 
-            offset = 0
-            length = 0                    
+#file_decrypt for a chunk of an entry that starts at position, only the part of the range inside the chunk is XORed
+#(check_range has to be called once with the whole entry length)
+def file_decrypt_at(flag, data, position, key=0, crc=0, file_length=0, file_original_length=0):
+    xor_range = decrypt_range(flag, key, crc, file_length, file_original_length)
+    if xor_range is None:
+        return data
+    start, size, base = xor_range
+    low, high = max(start, position), min(start + size, position + len(data))
+    if low >= high:
+        return data
+    data = writable(data)
+    buf = np.frombuffer(data, dtype=np.uint8)[low - position:high - position]
+    np.bitwise_xor(buf, KEY_RAMP[base + low - start:base + high - start], out=buf)
+    return data
 
-            if file_length < 0x80:
-                length = file_length
-            else:
-                offset = (v3 >> 1) % (file_length - 0x80)
-                length = (((v4 << 1) & 0xffffffff) % 0x60 + 0x20)
+def check_range(flag, length, key=0, crc=0, file_length=0, file_original_length=0):
+    xor_range = decrypt_range(flag, key, crc, file_length, file_original_length)
+    if xor_range is not None and xor_range[1] > 0 and xor_range[0] + xor_range[1] > length:
+        raise Exception("DECRYPTION RANGE OUT OF BOUNDS: {} BYTES AT {} OF {}".format(xor_range[1], xor_range[0], length))
 
-            key = (v3 ^ v4) & 0xff
-            data = bytearray(data)
+#decrypts many entries with a single XOR, items are (flag, data, crc, file_length, file_original_length)
+#returns a (data, algorithm) pair per item, in order, the encrypted ones are gathered in one buffer first
+def file_decrypt_batch(items, key=0):
+    results = []
+    pending = []
+    for flag, data, crc, file_length, file_original_length in items:
+        algorithm = decryption_algorithm(flag)
+        xor_range = decrypt_range(flag, key, crc, file_length, file_original_length)
+        if xor_range is None or xor_range[1] <= 0:
+            results.append((data, algorithm))
+            continue
+        check_range(flag, len(data), key, crc, file_length, file_original_length)
+        start, size, base = xor_range
+        pending.append((len(results), data, start, size, base))
+        results.append((None, algorithm))
+    if not pending:
+        return results
 
-            for xx in range(offset, min(offset + length, file_original_length)):
-                data[xx] ^= key
-                key = (key + 1) & 0xff
+    lengths = np.array([len(data) for _, data, _, _, _ in pending], dtype=np.int64)
+    offsets = np.zeros(len(pending), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=offsets[1:])
+    joined = bytearray(b"".join(data for _, data, _, _, _ in pending))
+    buf = np.frombuffer(joined, dtype=np.uint8)
 
-    return data
+    starts = np.array([start for _, _, start, _, _ in pending], dtype=np.int64) + offsets
+    sizes = np.array([size for _, _, _, size, _ in pending], dtype=np.int64)
+    bases = np.array([base for _, _, _, _, base in pending], dtype=np.int64)
+    #position j of every range: the start of its range + how far j is from the first position of that range
+    firsts = np.cumsum(sizes) - sizes
+    steps = np.arange(int(sizes.sum()), dtype=np.int64) - np.repeat(firsts, sizes)
+    positions = np.repeat(starts, sizes) + steps
+    buf[positions] ^= ((np.repeat(bases, sizes) + steps) & 0xFF).astype(np.uint8)
+
+    view = memoryview(joined)
+    for (i, _, _, _, _), offset, length in zip(pending, offsets.tolist(), lengths.tolist()):
+        results[i] = (view[offset:offset + length], results[i][1])
+    return results
@@ -1,139 +1,233 @@
+import re
+
+#magic numbers compiled into a prefix trie: a rule is (offset, magic, ext, priority), the rules at offset 0 are
+#looked up one leading byte at a time and the ones at other offsets (negative ones count from the end) by slicing
+#once per (offset, length), so the cost doesnt grow with the number of rules. When several rules match, the one
+#with the lowest priority wins (the one registered first for equal priorities)
+class MagicRegistry:
+    def __init__(self, rules=()):
+        self.rules = []
+        for rule in rules:
+            self.register(*rule)
+
+    def register(self, offset, magic, ext, priority=None):
+        if not magic:
+            raise Exception("EMPTY MAGIC FOR {}".format(ext))
+        if priority is None:
+            priority = max((rule[0] for rule in self.rules), default=-1) + 1
+        self.rules.append((priority, len(self.rules), offset, bytes(magic), ext))
+        self.compile()
+
+    def compile(self):
+        trie = {}
+        groups = {}
+        for rule in self.rules:
+            _, _, offset, magic, _ = rule
+            if offset == 0:
+                node = trie
+                for byte in magic:
+                    node = node.setdefault(byte, {})
+                #the None key of a node holds the best rule whose magic ends there
+                node[None] = min(node.get(None, rule), rule)
+            else:
+                group = groups.setdefault((offset, len(magic)), {})
+                group[magic] = min(group.get(magic, rule), rule)
+        self.trie = trie
+        self.groups = list(groups.items())
+        self.depth = max((len(rule[3]) for rule in self.rules if rule[2] == 0), default=0)
+
+    #the best matching rule, None if none match
+    #without end data is only the start of something longer, so the rules at negative offsets are skipped
+    def match_rule(self, data, end=True):
+        best = None
+        node = self.trie
+        for byte in data[:self.depth]:
+            node = node.get(byte)
+            if node is None:
+                break
+            rule = node.get(None)
+            if rule is not None and (best is None or rule < best):
+                best = rule
+        for (offset, length), group in self.groups:
+            if offset < 0 and (not end or len(data) < -offset):
+                continue
+            #a magic that ends at the end of the data (offset == -length) goes to the end, not to 0
+            rule = group.get(bytes(data[offset:offset + length or None]))
+            if rule is not None and (best is None or rule < best):
+                best = rule
+        return best
+
+    def match(self, data, end=True):
+        rule = self.match_rule(data, end)
+        return rule[4] if rule is not None else None
+
+#the compression / encryption found at the start of an entry before its type, in order
+COMPRESSION_TYPES = MagicRegistry([
+    (0, bytes([0x1D, 0x04]), 'rot', 0),
+    (0, bytes([0x15, 0x23]), 'rot', 0),
+    (0, b"NXS3\x03\x00\x00\x01", 'nxs3', 1),
+    (0, bytes([0x50, 0x4B, 0x03, 0x04]), 'zip', 2),
+    (0, bytes([0x50, 0x4B, 0x05, 0x06]), 'zip', 2),
+])
+
+#the types found by magic numbers at fixed places, in order: the first rule with any of its magics in place wins
+MAGIC_RULES = [
+    ('pyc', ((0, bytes([0xE3, 0x00, 0x00, 0x00])), (0, bytes([0x63, 0x00, 0x00, 0x00])), (2, bytes([0x0D, 0x0A])))),
+    ('coc', ((0, b'CocosStudio-UI'),)),
+    ('skeleton', ((0, b'SKELETON'),)),
+    ('hit', ((0, b'hit'),)),
+    ('pkm', ((0, b'PKM'),)),
+    ('pvr', ((0, b'PVR'),)),
+    ('dds', ((0, b'DDS'),)),
+    ('tga', ((-18, b'TRUEVISION-XFILE'), (0, bytes([0x00, 0x00, 0x02])), (0, bytes([0x0D, 0x00, 0x02])))),
+    ('bmp', ((0, b'BM'),)),
+    ('pyi', ((0, b'from typing import '),)),
+    ('ktx', ((1, b'KTX'),)),
+    ('png', ((1, b'PNG'),)),
+    ('mesh', ((0, bytes([0x34, 0x80, 0xC8, 0xBB])),)),
+    ('type1', ((0, bytes([0x14, 0x00, 0x00, 0x00])),)),
+    ('type2', ((0, bytes([0x04, 0x00, 0x00, 0x00])),)),
+    ('type3', ((0, bytes([0x00, 0x01, 0x00, 0x00])),)),
+    ('blasttool', ((1, bytes([0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00])),)),
+    ('vant', ((0, b'VANT'),)),
+    ('mdmp', ((0, b'MDMP'),)),
+    ('gis', ((0, b'RGIS'),)),
+    ('ntrk', ((0, b'NTRK'),)),
+    ('riff', ((0, b'RIFF'),)),
+    ('jpg', ((0, bytes([0xFF, 0xD8, 0xFF, 0xE1])),)),
+    ('bnk', ((0, b'BKHD'),)),
+    ('pem', ((0, b'-----BEING PUBLIC KEY-----'),)),
+    ('tpl', ((0, b'%'),)),
+    ('json', ((0, b'{'),)),
+    ('tzif', ((0, b'TZif'),)),
+    ('jfif', ((6, b'JFIF'),)),
+    ('mp4', ((4, b'ftyp'),)),
+    ('blast', ((0, b'NVidia(r) GameWorks Blast(tm) v.1'),)),
+    ('rawanimation', ((0, b'RAWANIMA'),)),
+    ('blastmesh', ((0, b'blastmesh'),)),
+]
+
+FILE_TYPES = MagicRegistry((offset, magic, ext, priority) for priority, (ext, magics) in enumerate(MAGIC_RULES) for offset, magic in magics)
+
+#adds a (game specific) type, without a priority it is checked after every type already there, a lower priority
+#than an existing type makes it win over that one (pyc has 0)
+def register_file_type(ext, offset, magic, priority=None):
+    FILE_TYPES.register(offset, magic, ext, priority)
+
 def get_compression(data):
     if len(data) == 0:
         return 'none'
-    elif data[:2] == bytes([0x1D, 0x04]) or data[:2] == bytes([0x15, 0x23]):
-        return 'rot'
-    elif data[0:8] == b"NXS3\x03\x00\x00\x01":
-        return 'nxs3'
-    elif data[:4] == bytes([0x50, 0x4B, 0x03, 0x04]) or data[:4] == bytes([0x50, 0x4B, 0x05, 0x06]):
+    return COMPRESSION_TYPES.match(data) or 'none'
+
+#'zip' or 'npk' when data is a container that can be opened, None otherwise
+def container_type(data):
+    if get_compression(data) == 'zip':
         return 'zip'
-    return 'none'
+    if bytes(data[:4]) in (b'NXPK', b'EXPK'):
+        return 'npk'
+    return None
+
+#TEXT_EXT_LIMIT is the size from which the text patterns arent looked for anymore
+TEXT_EXT_LIMIT = 100000000
 
 def get_ext(data):
+    return get_magic_ext(data) or (get_text_ext(data) if len(data) < TEXT_EXT_LIMIT else None) or 'dat'
+
+#type of an entry that was streamed (and never was in memory all at once), from its first bytes (head), its last
+#18 bytes (tail) and its size, the text patterns are only looked for in head
+#tail is None when the end of the entry isnt known, then the types found from the end of a file are skipped
+def get_stream_ext(head, tail, size):
+    if tail is None:
+        return get_magic_ext(head, False) or (get_text_ext(head) if size < TEXT_EXT_LIMIT else None) or 'dat'
+    return get_magic_ext(head + tail) or (get_text_ext(head) if size < TEXT_EXT_LIMIT else None) or 'dat'
+
+#the types found by magic numbers at fixed places, None if none of them match (see MagicRegistry.match_rule for end)
+def get_magic_ext(data, end=True):
     if len(data) == 0:
         return 'empty'
-    elif data[:4] == bytes([0xE3, 0x00, 0x00, 0x00]) or data[:4] == bytes([0x63, 0x00, 0x00, 0x00]) or data[2:4] == bytes([0x0D, 0x0A]):
-        return 'pyc'
-    elif data[:12] == b'CocosStudio-UI':
-        return 'coc'
-    elif data[:8] == b'SKELETON':
-        return 'skeleton'
-    elif data[:3] == b'hit':
-        return 'hit'
-    elif data[:3] == b'PKM':
-        return 'pkm'
-    elif data[:3] == b'PVR':
-        return 'pvr'
-    elif data[:3] == b'DDS':
-        return 'dds'
-    elif data[-18:-2] == b'TRUEVISION-XFILE' or data[:3] == bytes([0x00, 0x00, 0x02]) or data[:3] == bytes([0x0D, 0x00, 0x02]):
-        return 'tga'
-    elif data [:2] == b'BM':
-        return 'bmp'
-    elif data[:18] == b'from typing import ':
-        return 'pyi'
-    elif data[1:4] == b'KTX':
-        return 'ktx'
-    elif data[1:4] == b'PNG':
-        return 'png'
-    elif data[:4] == bytes([0x34, 0x80, 0xC8, 0xBB]):
-        return 'mesh'
-    elif data[:4] == bytes([0x14, 0x00, 0x00, 0x00]):
-        return 'type1'
-    elif data[:4] == bytes([0x04, 0x00, 0x00, 0x00]):
-        return 'type2'
-    elif data[:4] == bytes([0x00, 0x01, 0x00, 0x00]):
-        return 'type3'
-    elif data[1:8] == bytes([0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00]):
-        return 'blasttool'
-    elif data[:4] == b'VANT':
-        return 'vant'
-    elif data[:4] == b'MDMP':
-        return 'mdmp'
-    elif data[:4] == b'RGIS':
-        return 'gis'
-    elif data[:4] == b'NTRK':
-        return 'ntrk'
-    elif data[:4] == b'RIFF':
-        return 'riff'
-    elif data[:4] == bytes([0xFF,0xD8,0xFF,0xE1]):
-        return 'jpg'
-    elif data[:4] == b'BKHD':
-        return 'bnk'
-    elif data[:27] == b'-----BEING PUBLIC KEY-----':
-        return 'pem'
-    elif data[:1] == b'%':
-        return 'tpl'
-    elif data[:1] == b'{':
-        return 'json'
-    elif data[:4] == b'TZif':
-        return 'tzif'
-    elif data[6:10] == b'JFIF':
-        return 'jfif'
-    elif data[4:8] == b'ftyp':
-        return 'mp4'
-    elif data[:33] == b'NVidia(r) GameWorks Blast(tm) v.1':
-        return 'blast'
-    elif data[:8] == b'RAWANIMA':
-        return 'rawanimation'
-    elif data[:9] == b'blastmesh':
-        return 'blastmesh'
-    elif len(data) < 100000000:
-        #NeoXML file detection
-        if b'Type="Animation"' in data:
-            return 'animation'
-        if b'<AnimationConfig' in data:
-            return 'animconfig'
-        if b'<AnimationGraph' in data:
-            return 'animgraph'
-        if b'<Physics' in data:
-            return 'col'
-        if b'<EnvParticle' in data:
-            return 'envp'
-        if b'<MaterialGroup' in data:
-            return 'mtg'
-        if b'<Material' in data:
-            return 'mtl'
-        if b'<Chain' in data:  #needs more testing
-            return 'physicalbone'
-        if b'<PostProcess' in data:
-            return 'postprocess'
-        if b'DisableBakeLightProbe=' in data:  #needs more testing
-            return 'prefab'
-        if b'<FxGroup' in data:
-            return 'sfx'
-        if b'<MapSkeletonToMeshBone' in data:
-            return 'skeletonextra'
-        if b'<Macros' in data:
-            return 'xml.template'
-        if b'<Head Type="Timeline"' in data:
-            return 'timeline'
-        if b'<MetaInfo' in data:
-            return 'pvr.meta'
-        if b'precision mediump' in data:
-            return 'ps'
-        if b'POSITION' in data:
-            return 'vs'
-        if b'technique' in data:
-            return 'nfx'
-        if b'package google.protobuf' in data:
-            return 'proto'
-        if b'#ifndef' in data:
-            return 'h'
-        if b'#include <google/protobuf' in data:
-            return "cc"
-        if b'void' in data or b'main(' in data or b'include' in data or b'float' in data:
-            return 'shader'
-        if b'technique' in data or b'ifndef' in data:
-            return 'shader'
-        if b'?xml' in data:
-            return 'xml'
-        if b'<script' in data:
-            return 'html'
-        if b'Javascript' in data:
-            return 'js'
-        if b'biped' in data or b'bip001' in data or b'bone' in data or b'bone001' in data or b'bip01' in data:
-            return 'bip'
-        if b'div.document' in data:
-            return 'css'
-    return 'dat'
+    return FILE_TYPES.match(data, end)
+
+#the types found by text inside the data, in order: the first rule with any of its patterns in the data wins
+TEXT_RULES = [
+    #NeoXML file detection
+    ('animation', (b'Type="Animation"',)),
+    ('animconfig', (b'<AnimationConfig',)),
+    ('animgraph', (b'<AnimationGraph',)),
+    ('col', (b'<Physics',)),
+    ('envp', (b'<EnvParticle',)),
+    ('mtg', (b'<MaterialGroup',)),
+    ('mtl', (b'<Material',)),
+    ('physicalbone', (b'<Chain',)),  #needs more testing
+    ('postprocess', (b'<PostProcess',)),
+    ('prefab', (b'DisableBakeLightProbe=',)),  #needs more testing
+    ('sfx', (b'<FxGroup',)),
+    ('skeletonextra', (b'<MapSkeletonToMeshBone',)),
+    ('xml.template', (b'<Macros',)),
+    ('timeline', (b'<Head Type="Timeline"',)),
+    ('pvr.meta', (b'<MetaInfo',)),
+    ('ps', (b'precision mediump',)),
+    ('vs', (b'POSITION',)),
+    ('nfx', (b'technique',)),
+    ('proto', (b'package google.protobuf',)),
+    ('h', (b'#ifndef',)),
+    ('cc', (b'#include <google/protobuf',)),
+    ('shader', (b'void', b'main(', b'include', b'float')),
+    ('shader', (b'technique', b'ifndef')),
+    ('xml', (b'?xml',)),
+    ('html', (b'<script',)),
+    ('js', (b'Javascript',)),
+    ('bip', (b'biped', b'bip001', b'bone', b'bone001', b'bip01')),
+    ('css', (b'div.document',)),
+]
+
+#only the first TEXT_WINDOW bytes are searched by default (None searches everything)
+TEXT_WINDOW = 1 << 20
+
+#STREAM_HEAD is how much of the start of a streamed (or peeked) entry is kept for get_stream_ext, as much as
+#get_text_ext searches so the type is the same as when the entry is read whole
+STREAM_HEAD = TEXT_WINDOW
+
+#a regex alternation of literals shaped like a prefix trie ("<Ma(?:terial(?:Group)?)..."), so every byte is only
+#compared against the patterns that could still match there
+def trie_regex(patterns):
+    trie = {}
+    for pattern in patterns:
+        node = trie
+        for byte in pattern:
+            node = node.setdefault(byte, {})
+        node[None] = {}
+
+    def branch(node):
+        alternatives = [re.escape(bytes([byte])) + branch(node[byte]) for byte in sorted(key for key in node if key is not None)]
+        if not alternatives:
+            return b''
+        body = alternatives[0] if len(alternatives) == 1 else b'(?:' + b'|'.join(alternatives) + b')'
+        if None in node:
+            return b'(?:' + body + b')?'
+        return body
+    return re.compile(branch(trie))
+
+#rank of every pattern (position of the first rule that has it) and, for every rank, the regex of the patterns
+#that rank better than it
+TEXT_RANKS = {}
+for rank, (ext, patterns) in enumerate(TEXT_RULES):
+    for pattern in patterns:
+        TEXT_RANKS.setdefault(pattern, rank)
+TEXT_SEARCHES = [None] + [trie_regex([pattern for pattern in TEXT_RANKS if TEXT_RANKS[pattern] < rank]) for rank in range(1, len(TEXT_RULES) + 1)]
+
+#one pass over the data: after every match only the patterns that rank better than it are looked for, from where it
+#started (the trie gives the longest pattern at a place, a shorter one there could still rank better)
+def get_text_ext(data, window=TEXT_WINDOW):
+    if window is not None and len(data) > window:
+        data = memoryview(data)[:window]
+    best = len(TEXT_RULES)
+    position = 0
+    while best > 0:
+        match = TEXT_SEARCHES[best].search(data, position)
+        if match is None:
+            break
+        best = TEXT_RANKS[match.group()]
+        position = match.start()
+    if best < len(TEXT_RULES):
+        return TEXT_RULES[best][0]
+    return None
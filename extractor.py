@@ -1,47 +1,20 @@
 import shutil
-import os, struct, tempfile, argparse, zipfile
+import os, struct, argparse, zipfile
 import time
 from decompression import zflag_decompress, special_decompress, decompression_algorithm
 from decryption import file_decrypt, decryption_algorithm
 from detection import get_ext, get_compression
 from key import Keys
+from index import decode_index, entry_pointer, INDEX_FIELDS
+from reader import NpkReader
+from archive import file_size, read_nxfn_names
 from timeit import default_timer as timer
 
 #determines the info size by basic math (from the start of the index pointer // EOF or until NXFN data 
 def determine_info_size(f, var1, hashmode, encryptmode, index_offset, files):
     if encryptmode == 256 or hashmode == 2:
         return 0x1C
-    indexbuf = f.tell()
-    f.seek(index_offset)
-    buf = f.read()
-    f.seek(indexbuf)
-    return len(buf) // files
-
-#reads an entry of the NPK index, if its 28 the file sign is 32 bits and if its 32 its 64 bits (NeoX 1.2 / 2 shienanigans)
-def read_index(f, info_size, x, nxfn_files, index_offset):
-    if info_size == 28:
-        file_sign = [readuint32(f), f.tell() + index_offset]
-    elif info_size == 32:
-        file_sign = [readuint64(f), f.tell() + index_offset]
-    file_offset = readuint32(f)
-    file_length = readuint32(f)
-    file_original_length = readuint32(f)
-    zcrc = readuint32(f)                #compressed crc
-    crc = readuint32(f)                 #decompressed crc
-    zip_flag = readuint16(f)
-    file_flag = readuint16(f)
-    file_structure = nxfn_files[x] if nxfn_files else None
-    return (
-        file_sign,
-        file_offset, 
-        file_length,
-        file_original_length,
-        zcrc,
-        crc,
-        file_structure,
-        zip_flag,
-        file_flag,
-        )
+    return max(file_size(f) - index_offset, 0) // files
 
 #data readers
 def readuint64(f):
@@ -110,8 +83,8 @@ def unpack(args, statusBar=None):
         if not os.path.exists(folder_path):
             os.mkdir(folder_path)
             
-        #opens the file
-        with open(path, 'rb') as f:
+        #opens the file (and memory maps it if --mmap is set)
+        with open(path, 'rb') as f, NpkReader(f, args.mmap) as reader:
             
             #this is the only thing that the force command does, doesnt read the bytes corresponding the NXPK / EXPK header
             if not args.force:
@@ -151,7 +124,6 @@ def unpack(args, statusBar=None):
             print_data(args.info, 3, "INDEXSIZE", info_size, "NXPK_DATA", 0)
             print("")
 
-            index_table = []
             nxfn_files = []
             
             #checks for the "hash mode"
@@ -165,10 +137,8 @@ def unpack(args, statusBar=None):
             if encryption_mode == 256 and args.nxfn_file:
                 with open(folder_path+"/NXFN_result.txt", "w") as nxfn:
                     #data reader goes to where the NXFN file starts, it starts with b"NXFN" + 12 bytes (unknown for now)
-                    f.seek(index_offset + (files * info_size) + 16)
-                    
                     #nxfn file entries are plaintext bytes, separated by an empty byte
-                    nxfn_files = [x for x in (f.read()).split(b'\x00') if x != b'']
+                    nxfn_files = list(read_nxfn_names(f, index_offset + (files * info_size) + 16, file_size(f)))
                     
                     #dumps this file into a file called NXFN_result.txt
                     for nxfnline in nxfn_files:
@@ -176,37 +146,24 @@ def unpack(args, statusBar=None):
             
             #does the same thing above, but doesnt write the file
             elif encryption_mode == 256:
-                f.seek(index_offset + (files * info_size) + 16)
-                nxfn_files = [x for x in (f.read()).split(b'\x00') if x != b'']
+                nxfn_files = list(read_nxfn_names(f, index_offset + (files * info_size) + 16, file_size(f)))
 
             #goes back to the index offset (or remains in the same place)
             f.seek(index_offset)
 
-            #opens a temporary file
-            with tempfile.TemporaryFile() as tmp:
-                
-                #reads the whole of the index file
-                data = f.read(files * info_size)
+            #reads the whole of the index file
+            data = f.read(files * info_size)
+
+            #if its an EXPK file, it decodes it with the custom XOR key
+            if pkg_type:
+                data = keys.decrypt(data)
+
+            #decodes the whole table at once into columns (only the first entry if its only supposed to read one file)
+            index = decode_index(data, info_size, 1 if args.do_one else files)
+            index_table = zip(*(index[name].tolist() for name in INDEX_FIELDS))
 
-                #if its an EXPK file, it decodes it with the custom XOR key
-                if pkg_type:
-                    data = keys.decrypt(data)
-                    
-                #writes the data
-                tmp.write(data)
-                
-                #goes to the start of the file
-                tmp.seek(0)
-                
-                #checks if its only supposed to read one file, then it reads the data and adds it to a list as touples with the info itself
-                if args.do_one:
-                    index_table.append(read_index(tmp, info_size, 0, nxfn_files, index_offset))
-                else:
-                    for x in range(files):
-                        index_table.append(read_index(tmp, info_size, x, nxfn_files, index_offset))
-                        
             #calculates how many files it should analyse before reporting progress in the console (and adds 1 to not divide by 0)
-            step = len(index_table) // 50 + 1
+            step = files // 50 + 1
 
             #goes through every index in the index table
             for i, item in enumerate(index_table):
@@ -220,27 +177,26 @@ def unpack(args, statusBar=None):
                     print('FILE: {}/{}  ({}%)\n'.format(i + 1, files, ((i + 1) / files) * 100))
                     
                 #unpacks the index
-                file_sign, file_offset, file_length, file_original_length, zcrc, crc, file_structure, zflag, file_flag = item
+                file_sign, file_offset, file_length, file_original_length, zcrc, crc, zflag, file_flag = item
+                file_structure = nxfn_files[i] if nxfn_files else None
+                pointer = entry_pointer(i, info_size, index_offset)
                 
                 #prints the index data
-                print_data(args.info, 4,"FILESIGN:", hex(file_sign[0]), "VERBOSE_FILE", file_sign[1])
-                print_data(args.info, 3,"FILEOFFSET:", file_offset, "FILE", file_sign[1] + 4)
-                print_data(args.info, 3,"FILELENGTH:", file_length, "FILE", file_sign[1] + 8)
-                print_data(args.info, 4,"FILEORIGLENGTH:", file_original_length, "VERBOSE_FILE", file_sign[1] + 12)
-                print_data(args.info, 4,"ZIPCRCFLAG:", zcrc, "VERBOSE_FILE", file_sign[1] + 16)
-                print_data(args.info, 4,"CRCFLAG:", crc, "VERBOSE_FILE", file_sign[1] + 20)
-                print_data(args.info, 3,"ZFLAG:", zflag, "VERBOSE_FILE", file_sign[1] + 22)
-                print_data(args.info, 3,"FILEFLAG:", file_flag, "VERBOSE_FILE", file_sign[1] + 24)
-                
-                #goes to the offset where the file is indicated by the index
-                f.seek(file_offset)
+                print_data(args.info, 4,"FILESIGN:", hex(file_sign), "VERBOSE_FILE", pointer)
+                print_data(args.info, 3,"FILEOFFSET:", file_offset, "FILE", pointer + 4)
+                print_data(args.info, 3,"FILELENGTH:", file_length, "FILE", pointer + 8)
+                print_data(args.info, 4,"FILEORIGLENGTH:", file_original_length, "VERBOSE_FILE", pointer + 12)
+                print_data(args.info, 4,"ZIPCRCFLAG:", zcrc, "VERBOSE_FILE", pointer + 16)
+                print_data(args.info, 4,"CRCFLAG:", crc, "VERBOSE_FILE", pointer + 20)
+                print_data(args.info, 3,"ZFLAG:", zflag, "VERBOSE_FILE", pointer + 22)
+                print_data(args.info, 3,"FILEFLAG:", file_flag, "VERBOSE_FILE", pointer + 24)
                 
                 #checks if its empty, and if include_empty is false, skips it
                 if file_original_length == 0 and not args.include_empty:
                     continue
                 
-                #reads the amount of bytes corresponding to that file
-                data = f.read(file_length)
+                #reads the amount of bytes corresponding to that file (a memoryview of the map in --mmap mode)
+                data = reader.read(file_offset, file_length)
                 
                 #defines the method for the file structure (if it has NXFN structure, if not its 00000000.extension)
                 def check_file_structure():
@@ -290,8 +246,8 @@ def unpack(args, statusBar=None):
                         dat.write(data)
                         
                     #extracts the zip file
-                    with zipfile.ZipFile(file_path, 'r') as zip:
-                        zip.extractall(file_path[0:-4])
+                    with zipfile.ZipFile(file_path, 'r') as zip_file:
+                        zip_file.extractall(file_path[0:-4])
                         
                     #deletes the zip file 
                     if args.delete_compressed:
@@ -342,6 +298,7 @@ def get_parser():
     parser.add_argument('--convert-images', help="Automatically converts KTX, PVR and ASTC to PNG files (WARNING, SUPER SLOW)",action="store_true")
     parser.add_argument('--include-empty', help="Prints empty files", action="store_false")
     parser.add_argument('--do-one', action='store_true', help='Only do the first file (TESTING PURPOSES)')
+    parser.add_argument('--mmap', action='store_true', help="Memory-map the NPK file and read entries without copying them (faster on big files)")
     opt = parser.parse_args()
     return opt
 
@@ -1,55 +1,22 @@
 import shutil
-import os, struct, tempfile, argparse, zipfile
+import os, argparse
+import numpy as np
 import time
-from decompression import zflag_decompress, special_decompress, decompression_algorithm
-from decryption import file_decrypt, decryption_algorithm
-from detection import get_ext, get_compression
+from decompression import decompression_algorithm, special_decompress, zflag_decompress
+from decryption import decryption_algorithm
+from detection import get_ext, get_compression, get_stream_ext, STREAM_HEAD
 from key import Keys
+from index import entry_pointer, INDEX_FIELDS
+from archive import NpkArchive, EntryReader, decompress_entry, decrypt_entries, stream_entry, should_stream, determine_info_size, readuint64, readuint32, readuint16, readuint8
+from workers import run_entries, choose_backend, default_jobs
+from scheduler import find_npks, run_archives
+from sinks import make_sink, DirectorySink, NullSink, SINKS
+from nested import container_type, container_folder, expand_container, NESTED_DEPTH
+from verify import verify_archive
+from listing import list_archive, LIST_FORMATS
+from manifest import load_manifest, save_manifest, entry_identity, is_unchanged
 from timeit import default_timer as timer
 
-def determine_info_size(f, var1, hashmode, encryptmode, index_offset, files):
-    if encryptmode == 256:
-        return 0x1C
-    indexbuf = f.tell()
-    f.seek(index_offset)
-    buf = f.read()
-    f.seek(indexbuf)
-    return len(buf) // files
-
-def read_index(f, info_size, x, nxfn_files):
-    if info_size == 28:
-        file_sign = [readuint32(f), f.tell()]
-    elif info_size == 32:
-        file_sign = [readuint64(f), f.tell()]
-    file_offset = readuint32(f)
-    file_length = readuint32(f)
-    file_original_length = readuint32(f)
-    zcrc = readuint32(f)                #compressed crc
-    crc = readuint32(f)                 #decompressed crc
-    zip_flag = readuint16(f)
-    file_flag = readuint16(f)
-    file_structure = nxfn_files[x] if nxfn_files else None
-    return (
-        file_sign,
-        file_offset, 
-        file_length,
-        file_original_length,
-        zcrc,
-        crc,
-        file_structure,
-        zip_flag,
-        file_flag,
-        )
-
-def readuint64(f):
-    return struct.unpack('Q', f.read(8))[0]
-def readuint32(f):
-    return struct.unpack('I', f.read(4))[0]
-def readuint16(f):
-    return struct.unpack('H', f.read(2))[0]
-def readuint8(f):
-    return struct.unpack('B', f.read(1))[0]
-
 def print_data(verblevel, minimumlevel, text, data, typeofdata, pointer=0):
     match verblevel:
         case 1:
@@ -68,155 +35,295 @@ def print_data(verblevel, minimumlevel, text, data, typeofdata, pointer=0):
             if verblevel >= minimumlevel:
                 print("{:10} {} {}   DATA TYPE:{}".format(pointer, text, data, typeofdata))
 
-def unpack(args, statusBar=None):
-    allfiles = []
+#entries bigger than this are streamed by default (--stream-mb)
+STREAM_MB = 256
+
+#bytes from which entries are decoded a chunk at a time (--stream-mb)
+def stream_size(args):
+    return getattr(args, 'stream_mb', STREAM_MB) * 1048576
+
+#the entries that are decoded a chunk at a time
+def is_streamed(args, file_length, file_original_length, zflag):
+    return should_stream(stream_size(args), file_length, file_original_length, zflag)
+
+#threads used for the files inside a ZIP / NPK found in the NPK
+def member_jobs(args):
+    return getattr(args, 'jobs', 1) or default_jobs()
+
+#the --types values ("mesh,dds" or several --types) as a set of lowercase extensions, None if there are none
+def parse_types(values):
+    if not values:
+        return None
+    return {ext.strip().lower().lstrip('.') for value in values for ext in value.split(',') if ext.strip()}
+
+#decodes a big entry a chunk at a time into a spool of the sink, so it is never in memory all at once
+#returns None (with nothing written) when the data turns out to be rotor / NXS3, those can only be decoded in memory
+def extract_streamed(args, reader, keys, pkg_type, sink, zstd_dict, item, check_file_structure):
+    file_sign, file_offset, file_length, file_original_length, zcrc, crc, zflag, file_flag = item
+    source = EntryReader(reader, keys, pkg_type, file_flag, crc, file_offset, file_length, file_original_length, getattr(args, 'key', None) or 0)
+    spool = sink.spool()
+    head = b''
+    tail = b''
+    size = 0
     try:
-        if args.info is None:
-            args.info = 0
-        if args.path is None or os.path.isdir(args.path):
-            allfiles = [args.path + "/" + x for x in os.listdir(args.path) if x.endswith(".npk")]
-        else:
-            allfiles.append(args.path)
-    except TypeError as e:
-        print("NPK files not found")
-        return  # Exit early if there's an error
+        for chunk in stream_entry(source, zflag, zstd_dict):
+            if len(head) < STREAM_HEAD:
+                checked = len(head) >= 8
+                head += bytes(chunk[:STREAM_HEAD - len(head)])
+                if not checked and len(head) >= 8 and get_compression(head) in ('rot', 'nxs3'):
+                    sink.discard(spool)
+                    return None
+            tail = (tail + bytes(chunk[-18:]))[-18:]
+            spool.write(chunk)
+            size += len(chunk)
+    except Exception:
+        sink.discard(spool)
+        raise
 
-    keys = Keys()
+    print_data(args.info, 4, "COMPRESSION1:", get_compression(head).upper() + " (STREAMED)", "FILE", file_offset)
+    kind = container_type(head)
+    depth = getattr(args, 'nested_depth', NESTED_DEPTH)
+    if kind is not None and depth > 0:
+        file_name = check_file_structure(kind)
+        folder = container_folder(file_name)
+        print_data(args.info, 5, "FILENAME_" + kind.upper() + ":", sink.path(file_name), "FILE", file_offset)
+        if isinstance(sink, NullSink):
+            sink.commit(spool, file_name, size)
+            return file_name
+        if isinstance(sink, DirectorySink):
+            file_path = sink.commit(spool, file_name, size)
+            with open(file_path, 'rb') as f:
+                expand_container(kind, f, folder, sink, keys, depth, member_jobs(args), args.delete_compressed)
+            if args.delete_compressed:
+                os.remove(file_path)
+                return folder
+            return file_name
+        spool.seek(0)
+        expand_container(kind, spool, folder, sink, keys, depth, member_jobs(args), args.delete_compressed)
+        if args.delete_compressed:
+            sink.discard(spool)
+            return folder
+        sink.commit(spool, file_name, size)
+        return file_name
+
+    file_name = check_file_structure(kind or get_stream_ext(head, tail, size))
+    print_data(args.info, 3, "FILENAME:", sink.path(file_name), "FILE", file_offset)
+    sink.commit(spool, file_name, size)
+    return file_name
+
+#the small entries of a batch are read and decrypted together (run_entries gives the result to extract_entry)
+def prepare_entries(reader, keys, context, tasks):
+    args, pkg_type = context[:2]
+    return decrypt_entries(reader, keys, pkg_type, [item for _, item, _ in tasks], getattr(args, 'key', None) or 0)
+
+#stored is the (data, algorithm) decrypt_entries gave for the entry, None to read and decrypt it here
+def extract_entry(reader, keys, context, i, item, file_structure, stored=None):
+    args, pkg_type, sink, files, info_size, zstd_dict = context
+    step = files // 50 + 1
+    if ((i % step == 0 or i + 1 == files) and args.info <= 2 and args.info != 0) or args.info > 2:
+        print(f'FILE: {i + 1}/{files}')
+    file_sign, file_offset, file_length, file_original_length, zcrc, crc, zflag, file_flag = item
+    pointer = entry_pointer(i, info_size)
+    print_data(args.info, 4, "FILESIGN:", file_sign, "VERBOSE_FILE", pointer)
+    print_data(args.info, 3, "FILEOFFSET:", file_offset, "FILE", pointer + 4)
+    print_data(args.info, 4, "FILELENGTH:", file_length, "VERBOSE_FILE", pointer + 8)
+    print_data(args.info, 4, "FILEORIGLENGTH:", file_original_length, "VERBOSE_FILE", pointer + 12)
+    print_data(args.info, 4, "ZIPCRCFLAG:", zcrc, "VERBOSE_FILE", pointer + 16)
+    print_data(args.info, 4, "CRCFLAG:", crc, "VERBOSE_FILE", pointer + 20)
+    print_data(args.info, 3, "ZFLAG:", zflag, "VERBOSE_FILE", pointer + 22)
+    print_data(args.info, 3, "FILEFLAG:", file_flag, "VERBOSE_FILE", pointer + 24)
+
+    def check_file_structure(ext):
+        if file_structure and not args.no_nxfn:
+            return file_structure
+        return '{:08}.{}'.format(i, ext)
+
+    print_data(args.info, 5, "DECRYPTION:", stored[1] if stored is not None else decryption_algorithm(file_flag), "FILE", file_offset)
+    print_data(args.info, 5, "COMPRESSION0:", decompression_algorithm(zflag), "FILE", file_offset)
+
+    if is_streamed(args, file_length, file_original_length, zflag):
+        file_name = extract_streamed(args, reader, keys, pkg_type, sink, zstd_dict, item, check_file_structure)
+        if file_name is not None:
+            return file_name
+
+    if stored is not None:
+        data = zflag_decompress(zflag, stored[0], file_original_length, zstd_dict)
+    else:
+        data = reader.read(file_offset, file_length)
+        data = decompress_entry(data, keys, pkg_type, file_flag, zflag, crc, file_length, file_original_length, getattr(args, 'key', None) or 0, zstd_dict)
+    compression = get_compression(data)
+    #with --nxs3 the NXS3 data is also written as it is, next to the decoded file
+    nxs3_data = data if args.nxs3 and compression == 'nxs3' else None
+    data = special_decompress(compression, data)
+    print_data(args.info, 4, "COMPRESSION1:", compression.upper(), "FILE", file_offset)
+
+    kind = container_type(data)
+    depth = getattr(args, 'nested_depth', NESTED_DEPTH)
+    if kind is not None and depth > 0:
+        file_name = check_file_structure(kind)
+        folder = container_folder(file_name)
+        print_data(args.info, 5, "FILENAME_" + kind.upper() + ":", sink.path(file_name), "FILE", file_offset)
+        if not args.delete_compressed:
+            sink.write(file_name, data)
+        expand_container(kind, data, folder, sink, keys, depth, member_jobs(args), args.delete_compressed)
+        if args.delete_compressed:
+            return folder
+        return file_name
+
+    ext = kind or get_ext(data)
+    file_name = check_file_structure(ext)
+    print_data(args.info, 3, "FILENAME:", sink.path(file_name), "FILE", file_offset)
+    sink.write(file_name, data)
+    if nxs3_data is not None:
+        sink.write(os.path.splitext(file_name)[0] + ".nxs3", nxs3_data)
+    return file_name
 
-    for path in allfiles:
-        try:
-            start = timer()
-            print(f"UNPACKING: {path}")
-            folder_path = path[:-4]
-            if not os.path.exists(folder_path):
-                os.mkdir(folder_path)
-            with open(path, 'rb') as f:
-                if not args.force:
-                    data = f.read(4)
-                    pkg_type = None
-                    if data == b'NXPK':
-                        pkg_type = 0
-                    elif data == b'EXPK':
-                        pkg_type = 1
-                    else:
-                        raise Exception('NOT NXPK/EXPK FILE')
-                    print_data(args.info, 1, "FILE TYPE:", data, "NXPK", f.tell())
-                files = readuint32(f)
-                print_data(args.info, 1, "FILES:", files, "NXPK", f.tell())
-                print("")
-                var1 = readuint32(f)
-                print_data(args.info, 5, "UNKNOWN:", var1, "NXPK_DATA", f.tell())
-                encryption_mode = readuint32(f)
-                print_data(args.info, 2, "ENCRYPTMODE:", encryption_mode, "NXPK_DATA", f.tell())
-                hash_mode = readuint32(f)
-                print_data(args.info, 2, "HASHMODE:", hash_mode, "NXPK_DATA", f.tell())
-                index_offset = readuint32(f)
-                print_data(args.info, 2, "INDEXOFFSET:", index_offset, "NXPK_DATA", f.tell())
-
-                info_size = determine_info_size(f, var1, hash_mode, encryption_mode, index_offset, files)
-                print_data(args.info, 3, "INDEXSIZE", info_size, "NXPK_DATA", 0)
-                print("")
-
-                index_table = []
-                nxfn_files = []
-
-                if encryption_mode == 256 and args.nxfn_file:
-                    with open(folder_path + "/NXFN_result.txt", "w") as nxfn:
-                        f.seek(index_offset + (files * info_size) + 16)
-                        nxfn_files = [x for x in (f.read()).split(b'\x00') if x != b'']
-                        for nxfnline in nxfn_files:
-                            nxfn.write(nxfnline.decode() + "\n")
-                elif encryption_mode == 256:
-                    f.seek(index_offset + (files * info_size) + 16)
-                    nxfn_files = [x for x in (f.read()).split(b'\x00') if x != b'']
-
-                f.seek(index_offset)
-
-                with tempfile.TemporaryFile() as tmp:
-                    data = f.read(files * info_size)
-
-                    if pkg_type:
-                        data = keys.decrypt(data)
-                    tmp.write(data)
-                    tmp.seek(0)
-                    if args.do_one:
-                        index_table.append(read_index(tmp, info_size, 0, nxfn_files))
-                    else:
-                        for x in range(files):
-                            index_table.append(read_index(tmp, info_size, x, nxfn_files))
-
-                step = len(index_table) // 50 + 1
-
-                for i, item in enumerate(index_table):
-                    try:
-                        # Initialize variables to avoid unbound errors
-                        file_sign, file_offset, file_length, file_original_length, zcrc, crc, file_structure, zflag, file_flag = (None,)*9
-                        
-                        if ((i % step == 0 or i + 1 == files) and args.info <= 2 and args.info != 0) or args.info > 2:
-                            print(f'FILE: {i + 1}/{files}')
-                        file_sign, file_offset, file_length, file_original_length, zcrc, crc, file_structure, zflag, file_flag = item
-                        print_data(args.info, 4, "FILESIGN:", file_sign[0], "VERBOSE_FILE", file_sign[1])
-                        print_data(args.info, 3, "FILEOFFSET:", file_offset, "FILE", file_sign[1] + 4)
-                        print_data(args.info, 4, "FILELENGTH:", file_length, "VERBOSE_FILE", file_sign[1] + 8)
-                        print_data(args.info, 4, "FILEORIGLENGTH:", file_original_length, "VERBOSE_FILE", file_sign[1] + 12)
-                        print_data(args.info, 4, "ZIPCRCFLAG:", zcrc, "VERBOSE_FILE", file_sign[1] + 16)
-                        print_data(args.info, 4, "CRCFLAG:", crc, "VERBOSE_FILE", file_sign[1] + 20)
-                        print_data(args.info, 3, "ZFLAG:", zflag, "VERBOSE_FILE", file_sign[1] + 22)
-                        print_data(args.info, 3, "FILEFLAG:", file_flag, "VERBOSE_FILE", file_sign[1] + 24)
-                        f.seek(file_offset)
-                        data = f.read(file_length)
-
-                        def check_file_structure(ext):
-                            if file_structure and not args.no_nxfn:
-                                file_path = folder_path + "/" + file_structure.decode().replace("\\", "/")
-                                os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                            else:
-                                file_path = folder_path + '/{:08}.{}'.format(i, ext)
-                            return file_path
-
-                        if pkg_type:
-                            data = keys.decrypt(data)
-
-                        print_data(args.info, 5, "DECRYPTION:", decryption_algorithm(file_flag), "FILE", file_offset)
-
-                        data = file_decrypt(file_flag, data, crc, file_length, file_original_length)
-
-                        print_data(args.info, 5, "COMPRESSION0:", decompression_algorithm(zflag), "FILE", file_offset)
-
-                        data = zflag_decompress(zflag, data, file_original_length)
-
-                        compression = get_compression(data)
-                        print_data(args.info, 4, "COMPRESSION1:", compression.upper(), "FILE", file_offset)
-
-                        data = special_decompress(compression, data)
-
-                        if compression == 'zip':
-                            file_path = check_file_structure("zip")
-                            print_data(args.info, 5, "FILENAME_ZIP:", file_path, "FILE", file_offset)
-                            with open(file_path, 'wb') as dat:
-                                dat.write(data)
-                            with zipfile.ZipFile(file_path, 'r') as zip:
-                                zip.extractall(file_path[0:-4])
-                            if args.delete_compressed:
-                                os.remove(file_path)
+def unpack_archive(args, path, keys):
+    try:
+        start = timer()
+        print(f"UNPACKING: {path}")
+        folder_path = path[:-4]
+        sink_kind = getattr(args, 'sink', 'dir')
+        verify = getattr(args, 'verify', False)
+        list_format = getattr(args, 'list', None)
+        if ((sink_kind == 'dir' and not verify and not list_format) or args.nxfn_file) and not os.path.exists(folder_path):
+            os.mkdir(folder_path)
+        with NpkArchive(path, getattr(args, 'mmap', False), keys, args.force, cache=getattr(args, 'index_cache', False), zstd_dict=getattr(args, 'zstd_dict', None)) as archive:
+            reader = archive.reader
+            pkg_type = archive.pkg_type
+            files = archive.files
+            info_size = archive.info_size
+            pointer = archive.header_offset
+            if not args.force:
+                print_data(args.info, 1, "FILE TYPE:", archive.magic, "NXPK", pointer)
+            print_data(args.info, 1, "FILES:", files, "NXPK", pointer + 4)
+            print("")
+            print_data(args.info, 5, "UNKNOWN:", archive.var1, "NXPK_DATA", pointer + 8)
+            print_data(args.info, 2, "ENCRYPTMODE:", archive.encryption_mode, "NXPK_DATA", pointer + 12)
+            print_data(args.info, 2, "HASHMODE:", archive.hash_mode, "NXPK_DATA", pointer + 16)
+            print_data(args.info, 2, "INDEXOFFSET:", archive.index_offset, "NXPK_DATA", pointer + 20)
+            print_data(args.info, 3, "INDEXSIZE", info_size, "NXPK_DATA", 0)
+            print("")
+
+            nxfn_files = archive.names
+            if archive.encryption_mode == 256 and args.nxfn_file:
+                with open(folder_path + "/NXFN_result.txt", "w") as nxfn:
+                    for nxfnline in nxfn_files:
+                        nxfn.write(nxfnline.decode() + "\n")
+
+            index = archive.index
+            jobs = getattr(args, 'jobs', 1)
+            if jobs == 0:
+                jobs = default_jobs()
+            selected = archive.select(getattr(args, 'include', None), getattr(args, 'exclude', None), getattr(args, 'sign', None), getattr(args, 'folder', None))
+            types = parse_types(getattr(args, 'types', None))
+            peeked = None
+            if types or (list_format and getattr(args, 'list_types', False)):
+                peeked = archive.peek_types(selected, jobs)
+            if types:
+                #the entries that cant be peeked stay, so their error shows up when they are extracted
+                mask = np.array([ext is None or ext.lower() in types for ext in peeked], dtype=bool)
+                selected, peeked = selected[mask], peeked[mask]
+            if args.do_one:
+                selected, peeked = selected[:1], (peeked[:1] if peeked is not None else None)
+            if len(selected) != files:
+                print_data(args.info, 1, "SELECTED:", len(selected), "NXPK", 0)
+            if list_format:
+                out_path = folder_path + "_list." + list_format
+                listed = list_archive(archive, selected, out_path, list_format, peeked if getattr(args, 'list_types', False) else None)
+                print(f"LISTED - {listed} FILES IN {timer() - start:.2f} seconds ({out_path})")
+                return
+
+            columns = [index[name].tolist() for name in INDEX_FIELDS]
+            index_table = ((i, tuple(column[i] for column in columns)) for i in selected.tolist())
+
+            backend = getattr(args, 'backend', 'auto')
+            if jobs > 1 and backend == 'auto':
+                backend = choose_backend(pkg_type, index['file_flag'].tolist())
+
+            #the streamed entries make their own keystream a chunk at a time, so only the others need the shared one
+            key_length = 0
+            if pkg_type:
+                in_memory = [length for length, original, zflag in zip(index['file_length'][selected].tolist(), index['file_original_length'][selected].tolist(), index['zflag'][selected].tolist())
+                             if not is_streamed(args, length, original, zflag)]
+                key_length = max(in_memory, default=0)
+
+            if verify:
+                passed, failed = verify_archive(archive, selected, folder_path + "_verify.csv", jobs, backend, getattr(args, 'key', None) or 0, key_length, stream_size(args))
+                print(f"VERIFIED - {passed} PASSED, {failed} FAILED IN {timer() - start:.2f} seconds (REPORT: {folder_path}_verify.csv)")
+                return
+
+            sink = make_sink(sink_kind, folder_path)
+            if not isinstance(sink, DirectorySink) and backend == 'process':
+                backend = 'thread'
+
+            incremental = getattr(args, 'incremental', False) and isinstance(sink, DirectorySink)
+            manifest = load_manifest(folder_path) if incremental else {}
+            #the entries that are not selected this time keep their record, only the ones no longer in the NPK go
+            signs = set(index['file_sign'].tolist()) if incremental else set()
+            new_manifest = {file_sign: record for file_sign, record in manifest.items() if file_sign in signs}
+            identities = {}
+            skipped = 0
+
+            def pending():
+                nonlocal skipped
+                for i, item in index_table:
+                    if incremental:
+                        file_sign, identity = item[0], entry_identity(*item[2:6])
+                        if is_unchanged(manifest, sink, file_sign, identity):
+                            skipped += 1
                             continue
+                        identities[i] = (file_sign, identity)
+                    yield i, item, archive.name(i)
 
-                        ext = get_ext(data)
-                        file_path = check_file_structure(ext)
-                        print_data(args.info, 3, "FILENAME:", file_path, "FILE", file_offset)
-                        with open(file_path, 'wb') as dat:
-                            dat.write(data)
-                        if args.nxs3 and data2 is not None:
-                            with open(file_path[:-3] + "nxs3", "wb") as dat2:
-                                dat2.write(data2)
-                    except Exception as e:
-                        print(f"Error unpacking file index {i}: {e}")
-                        continue
-
-            end = timer()
-            print(f"FINISHED - DECOMPRESSED {files} FILES IN {end - start:.2f} seconds")
-        except Exception as e:
-            print(f"Error unpacking {path}: {e}")
+            context = (args, pkg_type, sink, files, info_size, archive.zstd_dict)
+            try:
+                for result in run_entries(extract_entry, pending(), context, reader, keys, path, jobs, backend, key_length, prepare_entries):
+                    if result.error is not None:
+                        print(f"Error unpacking file index {result.index}: {result.error}")
+                        if result.index in identities:
+                            new_manifest.pop(identities.pop(result.index)[0], None)
+                    elif incremental:
+                        file_sign, identity = identities.pop(result.index)
+                        new_manifest[file_sign] = (identity, result.file_path)
+            finally:
+                sink.close()
+
+            if incremental:
+                save_manifest(folder_path, new_manifest)
+                print_data(args.info, 1, "UNCHANGED (SKIPPED):", skipped, "NXPK", 0)
+
+        end = timer()
+        print(f"FINISHED - DECOMPRESSED {len(selected)} FILES IN {end - start:.2f} seconds")
+        if isinstance(sink, NullSink):
+            print(f"DECODED {sink.bytes / 1048576:.2f} MB ({sink.bytes / 1048576 / max(end - start, 1e-9):.2f} MB/s)")
+    except Exception as e:
+        print(f"Error unpacking {path}: {e}")
+
+def unpack(args, statusBar=None):
+    if args.info is None:
+        args.info = 0
+    path = args.path if args.path is not None else "."
+    if os.path.isdir(path):
+        allfiles = find_npks(path, getattr(args, 'recursive', False))
+    else:
+        allfiles = [path]
+    if not allfiles:
+        print("NPK files not found")
+        return
+
+    keys = Keys()
+
+    jobs = getattr(args, 'jobs', 1) or default_jobs()
+    handles_per_archive = 1 + (jobs if jobs > 1 and getattr(args, 'backend', 'auto') != 'thread' else 0)
+    run_archives(
+        lambda archive: unpack_archive(args, archive, keys),
+        allfiles,
+        getattr(args, 'archives', 1),
+        getattr(args, 'max_open_files', 0),
+        getattr(args, 'max_inflight_mb', 0) * 1024 * 1024,
+        handles_per_archive,
+        )
 
 def get_parser():
     parser = argparse.ArgumentParser(description='NXPK/EXPK Extractor', add_help=False)
@@ -229,7 +336,29 @@ def get_parser():
     parser.add_argument('--no-nxfn',action="store_true",help="Disables NXFN file structure")
     parser.add_argument('--do-one', action='store_true', help='Only do the first file (TESTING PURPOSES)')
     parser.add_argument('--nxs3', action='store_true', help="Keep NXS3 files if there's any")
+    parser.add_argument('-k', '--key', help="Select the key to use for FILEFLAG 1 (check the keys.txt for information)", type=int)
     parser.add_argument('-f','--force', help="Forces the NPK file to be extracted by ignoring the header",action="store_true")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="Number of entries to extract at the same time (0 uses every core)")
+    parser.add_argument('--backend', choices=['auto', 'thread', 'process'], default='auto', help="Worker pool used with --jobs, auto picks processes for EXPK files (the keystream is generated in pure python)")
+    parser.add_argument('-r', '--recursive', action='store_true', help="Also look for NPK files in every subfolder of the path")
+    parser.add_argument('--archives', type=int, default=1, help="Number of NPK files to extract at the same time (largest first)")
+    parser.add_argument('--max-open-files', type=int, default=0, help="Limit of file handles open at the same time across all NPK files (0 for no limit)")
+    parser.add_argument('--max-inflight-mb', type=int, default=0, help="Limit of the total size in MB of the NPK files being extracted at the same time (0 for no limit)")
+    parser.add_argument('--incremental', action='store_true', help="Keeps a manifest in the output folder and skips the files that didnt change since the last extraction")
+    parser.add_argument('--index-cache', action='store_true', help="Keeps the parsed header, index and NXFN names in a .npkidx file next to the NPK to open it faster next time")
+    parser.add_argument('--include', action='append', help="Only extract the files whose NXFN path matches this glob (like *.mesh or char/hero/*), can be used more than once")
+    parser.add_argument('--exclude', action='append', help="Skip the files whose NXFN path matches this glob, can be used more than once")
+    parser.add_argument('--sign', action='append', type=lambda x: int(x, 0), help="Only extract the file with this file sign (decimal or 0x hex), can be used more than once")
+    parser.add_argument('--folder', action='append', help="Only extract the files under this NXFN folder (like char/hero), can be used more than once")
+    parser.add_argument('--types', action='append', help="Only extract the files of these types (like mesh,dds), found by decoding only the start of every file, can be used more than once")
+    parser.add_argument('-o', '--sink', choices=SINKS, default='dir', help="Where the files go: loose files in a folder (default), one .tar, one uncompressed .zip, one .sqlite database or nowhere (null, for timing)")
+    parser.add_argument('--verify', action='store_true', help="Checks every file against the CRCs in the index without writing anything, the result of each file goes to a _verify.csv report next to the NPK")
+    parser.add_argument('--list', choices=LIST_FORMATS, help="Only lists the files (offset, lengths, CRCs, flags and NXFN name) into a _list.jsonl or _list.csv file next to the NPK, nothing is extracted")
+    parser.add_argument('--list-types', action='store_true', help="Adds the type of every file to --list (only the start of every file is decoded)")
+    parser.add_argument('--zstd-dict', help="Path of the zstd dictionary the ZStandard files were compressed with (by default it is looked for inside the NPK)", type=str)
+    parser.add_argument('--nested-depth', type=int, default=NESTED_DEPTH, help="How many levels of ZIP / NPK files inside the NPK (and inside those) are opened, 0 keeps them as they are")
+    parser.add_argument('--stream-mb', type=int, default=STREAM_MB, help="Files bigger than this (in MB) are decoded and written a chunk at a time instead of all at once, so they dont have to fit in memory (0 turns it off)")
+    parser.add_argument('--mmap', action='store_true', help="Memory-map the NPK file and read entries without copying them (faster on big files)")
     #nxs_unpack()
     opt = parser.parse_args()
     return opt
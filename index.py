@@ -0,0 +1,52 @@
+import numpy as np
+
+#layout of one NPK index entry, the 28 byte version has a 32 bit file sign and the 32 byte version a 64 bit one
+INDEX_FIELDS = ('file_sign', 'file_offset', 'file_length', 'file_original_length', 'zcrc', 'crc', 'zflag', 'file_flag')
+
+INDEX_DTYPES = {
+    28: np.dtype([
+        ('file_sign', '<u4'),
+        ('file_offset', '<u4'),
+        ('file_length', '<u4'),
+        ('file_original_length', '<u4'),
+        ('zcrc', '<u4'),                #compressed crc
+        ('crc', '<u4'),                 #decompressed crc
+        ('zflag', '<u2'),
+        ('file_flag', '<u2'),
+    ]),
+    32: np.dtype([
+        ('file_sign', '<u8'),
+        ('file_offset', '<u4'),
+        ('file_length', '<u4'),
+        ('file_original_length', '<u4'),
+        ('zcrc', '<u4'),
+        ('crc', '<u4'),
+        ('zflag', '<u2'),
+        ('file_flag', '<u2'),
+    ]),
+}
+
+#Onmyoji NPKs use their own 32 byte entry
+ONMYOJI_INDEX_DTYPE = np.dtype([
+    ('file_sign', '<u4'),
+    ('file_unknown', '<u4'),
+    ('file_offset', '<u4'),
+    ('file_length', '<u4'),
+    ('file_original_length', '<u4'),
+    ('file_hash_1', '<u4'),
+    ('file_hash_2', '<u4'),
+    ('file_flag', '<u4'),
+])
+
+#parses the whole index table in one go, returns a dict of column arrays (one per field)
+def decode_index(data, info_size, files, dtype=None):
+    if dtype is None:
+        if info_size not in INDEX_DTYPES:
+            raise Exception("UNSUPPORTED INDEX SIZE: {}".format(info_size))
+        dtype = INDEX_DTYPES[info_size]
+    table = np.frombuffer(data, dtype=dtype, count=files)
+    return {name: table[name] for name in dtype.names}
+
+#position of the first field after the file sign of an entry, used for the verbose printing
+def entry_pointer(i, info_size, index_offset=0):
+    return index_offset + i * info_size + info_size - 24
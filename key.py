@@ -1,53 +1,202 @@
-from copy import copy
-
-moba_xor_key = [
-    0x48, 0x5A, 0xC5, 0xFD, 0x8F, 0x70, 0xA6, 0xDD, 0x1C, 0x6F, 0xB8, 0x86, 0x83, 0x78, 0xB7, 0xF7,
-    0xF2, 0xB4, 0x76, 0x7F, 0xAB, 0x5C, 0x40, 0x84, 0xCC, 0xF8, 0x60, 0x9C, 0x12, 0x5B, 0x80, 0x15,
-    0x72, 0x9D, 0x99, 0x42, 0x92, 0x39, 0xD3, 0xBA, 0xA7, 0xC4, 0xA9, 0xC7, 0xD4, 0x47, 0xE3, 0x31,
-    0x43, 0xEC, 0x20, 0xB3, 0x4C, 0x14, 0x04, 0xD8, 0xA4, 0x8D, 0x73, 0x19, 0xF3, 0xD7, 0x79, 0x36,
-    0xF1, 0x2D, 0xFB, 0x68, 0xF6, 0x8E, 0xAF, 0xA0, 0xE4, 0x9B, 0x2E, 0x49, 0x53, 0xB2, 0x65, 0x3B,
-    0x0A, 0x3A, 0xC8, 0x54, 0xED, 0x00, 0xB5, 0x1D, 0xEA, 0x7B, 0x24, 0x71, 0x82, 0xC9, 0x26, 0x95,
-    0x56, 0x5F, 0xB1, 0x17, 0x74, 0x44, 0xBB, 0x52, 0xF4, 0x21, 0xAC, 0x96, 0x05, 0x1A, 0x10, 0x9E,
-    0xD9, 0xFF, 0x64, 0xC3, 0x4A, 0x62, 0xE2, 0x50, 0x97, 0xCA, 0xA1, 0x6A, 0x27, 0xBD, 0x6D, 0x5D,
-    0xF5, 0xA8, 0x32, 0x0F, 0x9F, 0x07, 0xFC, 0xCB, 0x8B, 0x4B, 0x37, 0x55, 0x0D, 0x41, 0xCE, 0xB6,
-    0x3E, 0x34, 0x8A, 0x18, 0x13, 0xBC, 0x87, 0x58, 0x46, 0x28, 0x5E, 0x2B, 0xEB, 0x63, 0x23, 0xDE,
-    0x30, 0x8C, 0xA5, 0x06, 0x02, 0x57, 0xDA, 0x98, 0x7A, 0x93, 0x38, 0x03, 0xE1, 0x66, 0xE7, 0xF0,
-    0x35, 0xD1, 0x6B, 0xDB, 0x08, 0xE6, 0xCD, 0x59, 0x01, 0xEE, 0x7C, 0x88, 0x33, 0xD2, 0xFA, 0x25,
-    0x89, 0xD0, 0x0C, 0x3D, 0xAA, 0xDC, 0xD6, 0xC6, 0xDF, 0xE0, 0x4F, 0x3F, 0x1F, 0x77, 0xA2, 0x75,
-    0xB0, 0xE8, 0x94, 0xAD, 0x7D, 0x6C, 0xC2, 0x22, 0xF9, 0xBE, 0xBF, 0x0B, 0xC1, 0x1B, 0x69, 0xEF,
-    0x29, 0x3C, 0xE9, 0xC0, 0x61, 0xE5, 0x6E, 0x2F, 0x9A, 0x51, 0xD5, 0x11, 0x67, 0x16, 0xCF, 0x1E,
-    0xAE, 0x4E, 0x0E, 0x81, 0x45, 0x2A, 0x91, 0x90, 0xFE, 0xA3, 0x09, 0x2C, 0x85, 0x4D, 0xB9, 0x7E,
-]
-
-
-class Keys:
-    def __init__(self):
-        self.keys = []
-
-    def gen_keys(self, lenght):
-        key_ = []
-        key_data = copy(moba_xor_key)
-        key_index = 0
-        key_tmp_index = 0
-        for i in range(lenght):
-            key_index += 1
-            tmp_data = key_data[key_index % 256]
-            key_tmp_index += tmp_data
-            key_tmp_index %= 256
-            key_data[key_index % 256] = key_data[key_tmp_index]
-            key_data[key_tmp_index] = tmp_data
-            key_i = key_data[(key_data[key_index % 256] + tmp_data) % 256 & 0xFF]
-            key_.append(key_i)
-        self.keys = key_
-
-    def ensure_keys(self, lenght):
-        if lenght > len(self.keys):
-            self.gen_keys(max(lenght, 2000000))
-
-    def decrypt(self, data):
-        self.ensure_keys(len(data))
-        data = bytearray(data)
-        for i in range(len(data)):
-            data[i] = data[i] ^ self.keys[i]
-        return data
-    
+import os, mmap, struct, threading
+from multiprocessing import shared_memory
+import numpy as np
+from copy import copy
+
+moba_xor_key = [
+    0x48, 0x5A, 0xC5, 0xFD, 0x8F, 0x70, 0xA6, 0xDD, 0x1C, 0x6F, 0xB8, 0x86, 0x83, 0x78, 0xB7, 0xF7,
+    0xF2, 0xB4, 0x76, 0x7F, 0xAB, 0x5C, 0x40, 0x84, 0xCC, 0xF8, 0x60, 0x9C, 0x12, 0x5B, 0x80, 0x15,
+    0x72, 0x9D, 0x99, 0x42, 0x92, 0x39, 0xD3, 0xBA, 0xA7, 0xC4, 0xA9, 0xC7, 0xD4, 0x47, 0xE3, 0x31,
+    0x43, 0xEC, 0x20, 0xB3, 0x4C, 0x14, 0x04, 0xD8, 0xA4, 0x8D, 0x73, 0x19, 0xF3, 0xD7, 0x79, 0x36,
+    0xF1, 0x2D, 0xFB, 0x68, 0xF6, 0x8E, 0xAF, 0xA0, 0xE4, 0x9B, 0x2E, 0x49, 0x53, 0xB2, 0x65, 0x3B,
+    0x0A, 0x3A, 0xC8, 0x54, 0xED, 0x00, 0xB5, 0x1D, 0xEA, 0x7B, 0x24, 0x71, 0x82, 0xC9, 0x26, 0x95,
+    0x56, 0x5F, 0xB1, 0x17, 0x74, 0x44, 0xBB, 0x52, 0xF4, 0x21, 0xAC, 0x96, 0x05, 0x1A, 0x10, 0x9E,
+    0xD9, 0xFF, 0x64, 0xC3, 0x4A, 0x62, 0xE2, 0x50, 0x97, 0xCA, 0xA1, 0x6A, 0x27, 0xBD, 0x6D, 0x5D,
+    0xF5, 0xA8, 0x32, 0x0F, 0x9F, 0x07, 0xFC, 0xCB, 0x8B, 0x4B, 0x37, 0x55, 0x0D, 0x41, 0xCE, 0xB6,
+    0x3E, 0x34, 0x8A, 0x18, 0x13, 0xBC, 0x87, 0x58, 0x46, 0x28, 0x5E, 0x2B, 0xEB, 0x63, 0x23, 0xDE,
+    0x30, 0x8C, 0xA5, 0x06, 0x02, 0x57, 0xDA, 0x98, 0x7A, 0x93, 0x38, 0x03, 0xE1, 0x66, 0xE7, 0xF0,
+    0x35, 0xD1, 0x6B, 0xDB, 0x08, 0xE6, 0xCD, 0x59, 0x01, 0xEE, 0x7C, 0x88, 0x33, 0xD2, 0xFA, 0x25,
+    0x89, 0xD0, 0x0C, 0x3D, 0xAA, 0xDC, 0xD6, 0xC6, 0xDF, 0xE0, 0x4F, 0x3F, 0x1F, 0x77, 0xA2, 0x75,
+    0xB0, 0xE8, 0x94, 0xAD, 0x7D, 0x6C, 0xC2, 0x22, 0xF9, 0xBE, 0xBF, 0x0B, 0xC1, 0x1B, 0x69, 0xEF,
+    0x29, 0x3C, 0xE9, 0xC0, 0x61, 0xE5, 0x6E, 0x2F, 0x9A, 0x51, 0xD5, 0x11, 0x67, 0x16, 0xCF, 0x1E,
+    0xAE, 0x4E, 0x0E, 0x81, 0x45, 0x2A, 0x91, 0x90, 0xFE, 0xA3, 0x09, 0x2C, 0x85, 0x4D, 0xB9, 0x7E,
+]
+
+
+#the keystream only depends on moba_xor_key, so it is saved here the first time and mapped afterwards
+#(worker processes map the same file, so they all share one copy of it in memory)
+KEYSTREAM_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "neox_tools", "expk_keystream.bin")
+KEYSTREAM_MAGIC = b'NXKS'
+KEYSTREAM_CHUNK = 2000000
+KEYSTREAM_HEADER = 272
+
+#the next lenght bytes of the keystream from a generator state (key_data, key_index, key_tmp_index), key_data is
+#changed in place, returns the bytes and the state after them
+def gen_keystream(state, lenght):
+    key_data, key_index, key_tmp_index = state
+    key_ = bytearray(lenght)
+    for i in range(lenght):
+        key_index += 1
+        tmp_data = key_data[key_index & 0xFF]
+        key_tmp_index = (key_tmp_index + tmp_data) & 0xFF
+        key_data[key_index & 0xFF] = key_data[key_tmp_index]
+        key_data[key_tmp_index] = tmp_data
+        key_[i] = key_data[(key_data[key_index & 0xFF] + tmp_data) & 0xFF]
+    return key_, (key_data, key_index, key_tmp_index)
+
+#EXPK keystream (RC4 style), kept as a uint8 array that grows in chunks when a longer one is needed
+#the generator state is kept too, so growing it continues where it stopped instead of starting over
+class Keys:
+    def __init__(self, cache_path=KEYSTREAM_CACHE):
+        self.keys = np.zeros(0, dtype=np.uint8)
+        self.state = None
+        self.cache_path = cache_path
+        self.lock = threading.Lock()
+
+    def gen_keys(self, lenght):
+        if self.state is None:
+            self.state = (copy(moba_xor_key), 0, 0)
+        key_, self.state = gen_keystream(self.state, max(lenght - len(self.keys), 0))
+        self.keys = np.concatenate([self.keys, np.frombuffer(key_, dtype=np.uint8)])
+
+    def ensure_keys(self, lenght):
+        if lenght <= len(self.keys):
+            return
+        with self.lock:
+            if self.state is None:
+                self.load_cache()
+            if lenght > len(self.keys):
+                self.gen_keys(max(lenght, len(self.keys) + KEYSTREAM_CHUNK))
+                self.save_cache()
+
+    #header of the cache file / shared memory: magic, generator state, then the keystream itself
+    def header(self):
+        key_data, key_index, key_tmp_index = self.state
+        return KEYSTREAM_MAGIC + struct.pack('<QI', key_index, key_tmp_index) + bytes(key_data)
+
+    #uses the keystream in buf (cache file or shared memory) without copying it, False if buf isnt valid
+    def load_buffer(self, buf):
+        if len(buf) < KEYSTREAM_HEADER or bytes(buf[:4]) != KEYSTREAM_MAGIC:
+            return False
+        key_index, key_tmp_index = struct.unpack_from('<QI', buf, 4)
+        if len(buf) - KEYSTREAM_HEADER < key_index:
+            return False
+        self.state = (list(buf[16:KEYSTREAM_HEADER]), key_index, key_tmp_index)
+        self.keys = np.frombuffer(buf, dtype=np.uint8, count=key_index, offset=KEYSTREAM_HEADER)
+        return True
+
+    def load_cache(self):
+        if not self.cache_path:
+            return False
+        try:
+            with open(self.cache_path, 'rb') as f:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+        return self.load_buffer(buf)
+
+    def save_cache(self):
+        if not self.cache_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with open(self.cache_path + ".tmp", 'wb') as f:
+                f.write(self.header())
+                f.write(self.keys.tobytes())
+            os.replace(self.cache_path + ".tmp", self.cache_path)
+        except OSError:
+            pass
+
+    #makes the keystream (at least lenght long) available to worker processes, returns a SharedKeys whose handle is
+    #what Keys.attach needs, it is the cache file when it has all of it, otherwise a shared memory block that belongs
+    #to the caller (close the SharedKeys when the workers are done)
+    def share(self, lenght=0):
+        self.ensure_keys(max(lenght, 1))
+        check = Keys(self.cache_path)
+        if check.load_cache() and len(check.keys) >= len(self.keys):
+            return SharedKeys(('file', self.cache_path))
+        header = self.header()
+        shared = shared_memory.SharedMemory(create=True, size=len(header) + len(self.keys))
+        shared.buf[:len(header)] = header
+        shared.buf[len(header):] = self.keys.tobytes()
+        return SharedKeys(('shm', shared.name), shared)
+
+    #Keys of a worker process, reads the keystream shared by the main process without copying it
+    #a None handle is an NPK without EXPK encryption, the workers dont need a keystream then
+    @classmethod
+    def attach(cls, handle):
+        if handle is None:
+            return cls(None)
+        kind, name = handle
+        if kind == 'file':
+            keys = cls(name)
+            keys.load_cache()
+        else:
+            keys = cls(None)
+            keys.shared = shared_memory.SharedMemory(name=name)
+            keys.load_buffer(keys.shared.buf)
+        return keys
+
+    #a KeyStream that goes on from the end of the keystream kept here, without making it longer
+    def stream(self):
+        self.ensure_keys(1)
+        with self.lock:
+            key_data, key_index, key_tmp_index = self.state
+            return KeyStream(self.keys, (list(key_data), key_index, key_tmp_index))
+
+    #XORs the whole buffer with the keystream at once, returns a new bytearray
+    #offset is where the buffer starts inside the entry (for entries that are decrypted in chunks)
+    def decrypt(self, data, offset=0):
+        self.ensure_keys(offset + len(data))
+        data = bytearray(data)
+        buf = np.frombuffer(data, dtype=np.uint8)
+        np.bitwise_xor(buf, self.keys[offset:offset + len(buf)], out=buf)
+        return data
+
+#the keystream of one entry read in order a chunk at a time (a streamed entry), the part already kept by Keys is
+#used as it is and the rest is generated for every chunk and dropped, so the memory doesnt depend on the entry size
+class KeyStream:
+    def __init__(self, known, state):
+        self.known = known
+        self.start = state
+        self.state = (list(state[0]),) + state[1:]
+        self.position = len(known)
+
+    def keys(self, offset, lenght):
+        end = offset + lenght
+        if end <= len(self.known):
+            return self.known[offset:end]
+        parts = []
+        if offset < len(self.known):
+            parts.append(self.known[offset:])
+            offset = len(self.known)
+        if offset < self.position:
+            self.state = (list(self.start[0]),) + self.start[1:]
+            self.position = len(self.known)
+        while self.position < offset:
+            _, self.state = gen_keystream(self.state, min(offset - self.position, KEYSTREAM_CHUNK))
+            self.position += min(offset - self.position, KEYSTREAM_CHUNK)
+        key_, self.state = gen_keystream(self.state, end - offset)
+        self.position = end
+        parts.append(np.frombuffer(key_, dtype=np.uint8))
+        return np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+    #same as Keys.decrypt
+    def decrypt(self, data, offset=0):
+        data = bytearray(data)
+        buf = np.frombuffer(data, dtype=np.uint8)
+        np.bitwise_xor(buf, self.keys(offset, len(buf)), out=buf)
+        return data
+
+#a keystream shared by Keys.share, every call gets its own shared memory block so several NPKs can be extracted
+#with processes at the same time
+class SharedKeys:
+    def __init__(self, handle, shared=None):
+        self.handle = handle
+        self.shared = shared
+
+    def close(self):
+        if self.shared is not None:
+            shared, self.shared = self.shared, None
+            shared.close()
+            shared.unlink()
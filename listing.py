@@ -0,0 +1,25 @@
+import csv, json
+from index import INDEX_FIELDS
+
+LIST_FORMATS = ['jsonl', 'csv']
+LIST_FIELDS = ('index',) + INDEX_FIELDS + ('name',)
+
+#writes one line per selected entry of an open NpkArchive (index fields + NXFN name), only the index is used
+#types (the NpkArchive.peek_types of selected) adds a type column
+def list_archive(archive, selected, out_path, fmt='jsonl', types=None):
+    columns = [selected.tolist()] + [archive.index[field][selected].tolist() for field in INDEX_FIELDS]
+    names = [archive.name(i) for i in columns[0]]
+    fields = LIST_FIELDS
+    rows = zip(*columns, names)
+    if types is not None:
+        fields = LIST_FIELDS + ('type',)
+        rows = zip(*columns, names, list(types))
+    with open(out_path, 'w', newline='') as out:
+        if fmt == 'csv':
+            writer = csv.writer(out)
+            writer.writerow(fields)
+            writer.writerows(rows)
+        else:
+            for row in rows:
+                out.write(json.dumps(dict(zip(fields, row))) + "\n")
+    return len(columns[0])
@@ -0,0 +1,28 @@
+import os, json
+
+#written inside the output folder of every NPK when extracting with --incremental
+MANIFEST_NAME = "NPK_manifest.json"
+
+#the index fields that tell if an entry changed between two versions of the same NPK
+def entry_identity(file_length, file_original_length, zcrc, crc):
+    return [file_length, file_original_length, zcrc, crc]
+
+#returns {file_sign: (identity, output path relative to the folder)}, empty if there is no manifest yet
+def load_manifest(folder_path):
+    try:
+        with open(os.path.join(folder_path, MANIFEST_NAME), "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return {int(sign): (identity, path) for sign, (identity, path) in data["entries"].items()}
+
+def save_manifest(folder_path, entries):
+    file_path = os.path.join(folder_path, MANIFEST_NAME)
+    with open(file_path + ".tmp", "w") as f:
+        json.dump({"entries": {str(sign): [identity, path] for sign, (identity, path) in entries.items()}}, f)
+    os.replace(file_path + ".tmp", file_path)
+
+#an entry can be skipped when the index still has the same crcs / lengths and its output is still in the sink
+def is_unchanged(manifest, sink, file_sign, identity):
+    record = manifest.get(file_sign)
+    return record is not None and record[0] == identity and sink.exists(record[1])
@@ -0,0 +1,113 @@
+import numpy as np
+from array import array
+
+#the NXFN name table kept as it is in the NPK (one blob, names separated by an empty byte) plus the start / end
+#offset of every name, so there are no per name objects until a name is asked for. Empty names are skipped
+class NameTable:
+    def __init__(self, blob=b''):
+        self.blob = blob
+        buf = np.frombuffer(blob, dtype=np.uint8)
+        zeros = np.flatnonzero(buf == 0)
+        starts = np.concatenate(([0], zeros + 1))
+        ends = np.concatenate((zeros, [len(buf)]))
+        keep = ends > starts
+        dtype = np.uint32 if len(buf) < 1 << 32 else np.uint64
+        self.starts = starts[keep].astype(dtype)
+        self.ends = ends[keep].astype(dtype)
+
+    def __len__(self):
+        return len(self.starts)
+
+    #the raw bytes of a name (with the separators of the NPK)
+    def __getitem__(self, i):
+        if not -len(self) <= i < len(self):
+            raise IndexError("NAME {} OUT OF RANGE".format(i))
+        return bytes(self.blob[int(self.starts[i]):int(self.ends[i])])
+
+    def __iter__(self):
+        for start, end in zip(self.starts.tolist(), self.ends.tolist()):
+            yield bytes(self.blob[start:end])
+
+    #the name as a path with / separators
+    def path(self, i):
+        return self[i].decode().replace("\\", "/")
+
+class DirectoryNode:
+    __slots__ = ('children', 'files', 'count')
+
+    def __init__(self):
+        self.children = {}
+        self.files = array('I')
+        self.count = 0
+
+#the folders of the names of a NameTable as a trie, every folder knows its subfolders, the entries right in it and how
+#many entries there are under it, only the first files names are used (the ones that have an index entry)
+class DirectoryTrie:
+    def __init__(self, names, files):
+        self.root = DirectoryNode()
+        folders = {'': self.root}
+        #the folder of every name ends at its last separator, found for all the names at once in the blob
+        count = min(len(names), files)
+        starts = names.starts[:count].astype(np.int64)
+        buf = np.frombuffer(names.blob, dtype=np.uint8)
+        separators = np.flatnonzero((buf == ord('/')) | (buf == ord('\\')))
+        last = np.searchsorted(separators, names.ends[:count].astype(np.int64)) - 1
+        folder_ends = separators[np.maximum(last, 0)] if len(separators) else np.zeros(count, dtype=np.int64)
+        folder_ends = np.where((last >= 0) & (folder_ends >= starts), folder_ends, starts)
+        grouped = {}
+        for i, (start, end) in enumerate(zip(starts.tolist(), folder_ends.tolist())):
+            grouped.setdefault(bytes(names.blob[start:end]), []).append(i)
+        for folder, positions in grouped.items():
+            folder = folder.decode().replace("\\", "/")
+            node = folders.get(folder)
+            if node is None:
+                node = self.add_folder(folders, folder)
+            node.files.extend(positions)
+        #counts go from the deepest folders up
+        for folder in sorted(folders, key=lambda folder: -folder.count('/') - (folder != '')):
+            node = folders[folder]
+            node.count = len(node.files) + sum(child.count for child in node.children.values())
+
+    def add_folder(self, folders, folder):
+        parent_folder, _, base = folder.rpartition('/')
+        parent = folders.get(parent_folder)
+        if parent is None:
+            parent = self.add_folder(folders, parent_folder)
+        node = folders[folder] = parent.children.setdefault(base, DirectoryNode())
+        return node
+
+    #the node of a folder ("char/hero", "" is the root), None if there is no such folder
+    def find(self, folder):
+        node = self.root
+        for part in folder.replace("\\", "/").split("/"):
+            if part == '':
+                continue
+            node = node.children.get(part)
+            if node is None:
+                return None
+        return node
+
+    def node(self, folder):
+        node = self.find(folder)
+        if node is None:
+            raise Exception("FOLDER NOT FOUND: {}".format(folder))
+        return node
+
+    #(subfolder names, positions of the entries right in the folder), both sorted
+    def listdir(self, folder=''):
+        node = self.node(folder)
+        return sorted(node.children), np.array(node.files, dtype=np.int64)
+
+    #number of entries in the folder and all of its subfolders
+    def count(self, folder=''):
+        return self.node(folder).count
+
+    #sorted positions of the entries in the folder and all of its subfolders
+    def under(self, folder=''):
+        pending = [self.node(folder)]
+        found = []
+        while pending:
+            node = pending.pop()
+            found.append(np.array(node.files, dtype=np.int64))
+            pending.extend(node.children.values())
+        return np.sort(np.concatenate(found))
@@ -0,0 +1,62 @@
+import io, os, zipfile
+from concurrent.futures import ThreadPoolExecutor
+from detection import get_ext, container_type
+from archive import NpkArchive
+
+#how many levels of containers inside containers (ZIP or NPK files inside the NPK) are opened by default
+NESTED_DEPTH = 4
+
+#folder the members of a container go to ("a/b.zip" -> "a/b")
+def container_folder(path):
+    root, ext = os.path.splitext(path)
+    if ext.lower() in ('.zip', '.npk'):
+        return root
+    return path + ".extracted"
+
+#member names cant get out of the folder of their container (same as zipfile extractall)
+def member_path(name):
+    parts = [part for part in name.replace("\\", "/").split("/") if part not in ('', '.', '..')]
+    return "/".join(parts)
+
+#(name, read) of every file inside a container, source is the data (bytes / memoryview) or a seekable file
+def open_container(kind, source, keys):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    if kind == 'zip':
+        container = zipfile.ZipFile(source, 'r')
+        members = [(member.filename, lambda member=member: container.read(member)) for member in container.infolist() if not member.is_dir()]
+    else:
+        container = NpkArchive("<nested>", False, keys, fileobj=source)
+        members = [(container.name(i), lambda i=i: container.read(i)) for i in range(len(container))]
+    return container, members
+
+#writes every file of a container to sink under folder (opening the containers inside it too while depth > 1)
+#with jobs > 1 the members of this container are written from several threads, returns how many files were written
+def expand_container(kind, source, folder, sink, keys, depth=NESTED_DEPTH, jobs=1, delete_compressed=False):
+    container, members = open_container(kind, source, keys)
+
+    def write_member(numbered):
+        i, (name, read) = numbered
+        try:
+            data = read()
+            inner = container_type(data)
+            #members without a name (or with one like "../") get a numbered name, like the entries of an NPK
+            name = member_path(name) if name else ''
+            if not name:
+                name = '{:08}.{}'.format(i, inner or get_ext(data))
+            path = folder + "/" + name
+            if inner is None or depth <= 1:
+                sink.write(path, data)
+                return 1
+            if not delete_compressed:
+                sink.write(path, data)
+            return expand_container(inner, data, container_folder(path), sink, keys, depth - 1, 1, delete_compressed)
+        except Exception as e:
+            print(f"Error unpacking {folder}/{name or i}: {e}")
+            return 0
+
+    with container:
+        if jobs > 1 and len(members) > 1:
+            with ThreadPoolExecutor(min(jobs, len(members))) as pool:
+                return sum(pool.map(write_member, enumerate(members)))
+        return sum(map(write_member, enumerate(members)))
@@ -1,7 +1,8 @@
-import os, struct, zlib, tempfile, argparse
+import os, struct, zlib, argparse
 from tqdm import tqdm
 import extractorNEW as ext
 from extractorNEW import readuint32, get_ext, get_parser
+from index import decode_index, ONMYOJI_INDEX_DTYPE
 
 def decrypt(data):
     data = bytearray(data)
@@ -24,27 +25,14 @@ def unpack(path):
         var3 = readuint32(f)
         index_offset = readuint32(f)
         f.seek(index_offset)
-        index_table = []
-        with tempfile.TemporaryFile() as tmp:
-            data = f.read(files * 32)
-
-            tmp.write(data)
-            tmp.seek(0)
-            for _ in range(files):
-                file_sign = readuint32(tmp)
-                file_unknown = readuint32(tmp)
-                file_offset = readuint32(tmp)
-                file_length = readuint32(tmp)
-                file_original_length = readuint32(tmp)
-                file_hash_1 = readuint32(tmp)
-                file_hash_2 = readuint32(tmp)
-                file_flag = readuint32(tmp)
-                index_table.append((
-                    file_offset, 
-                    file_length,
-                    file_original_length, 
-                    file_flag,
-                    ))
+        data = f.read(files * 32)
+        index = decode_index(data, 32, files, ONMYOJI_INDEX_DTYPE)
+        index_table = zip(
+            index['file_offset'].tolist(),
+            index['file_length'].tolist(),
+            index['file_original_length'].tolist(),
+            index['file_flag'].tolist(),
+            )
 
         for i, item in enumerate(index_table):
             file_name = '{:8}.dat'.format(i)
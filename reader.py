@@ -0,0 +1,43 @@
+import io, mmap, os, threading
+
+#reads slices of an NPK file, either with seek + read or straight out of a memory map
+#in mmap mode every read returns a memoryview of the mapped file, so entries that need
+#no decryption / decompression are never copied before they are written out
+#NPKs that are already in memory (an io.BytesIO, like an NPK inside another NPK) are read from its buffer the same way
+#reads are safe to do from several threads at once
+class NpkReader:
+    def __init__(self, f, use_mmap=False):
+        self.f = f
+        self.lock = threading.Lock()
+        self.map = None
+        self.view = None
+        if isinstance(f, io.BytesIO):
+            self.view = f.getbuffer()
+        elif use_mmap and os.fstat(f.fileno()).st_size > 0:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.view = memoryview(self.map)
+
+    def read(self, offset, length):
+        if self.view is not None:
+            return self.view[offset:offset + length]
+        with self.lock:
+            self.f.seek(offset)
+            return self.f.read(length)
+
+    def close(self):
+        if self.view is not None:
+            self.view.release()
+            self.view = None
+        if self.map is not None:
+            try:
+                self.map.close()
+            except BufferError:
+                #a slice handed out is still alive, the map gets freed together with it
+                pass
+            self.map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,3 +1,6 @@
+import numpy as np
+from functools import lru_cache
+
 class newrotor(object):
 
     def __init__(self, key, n_rotors=6):
@@ -17,61 +20,99 @@ class newrotor(object):
         self.positions[1] = None
         return self.cryptmore(buf, 1)
 
-    def cryptmore(self, buf, do_decrypt):
+    #bulk version of the byte by byte rotor machine, out is an optional preallocated bytearray (at least len(buf))
+    #the positions only depend on how many bytes went through, so they are worked out for a whole chunk at
+    #once and then every rotor is one table lookup over the chunk
+    def cryptmore(self, buf, do_decrypt, out=None):
         size, nr, rotors, pos = self.get_rotors(do_decrypt)
-        outbuf = b''
-        for c in buf:
+        tables = rotor_arrays(self.key, nr)[do_decrypt]
+        increments = [rotors[i][size] for i in range(nr)]
+        data = np.frombuffer(buf, dtype=np.uint8)
+        if out is None:
+            out = bytearray(len(data))
+        result = np.frombuffer(out, dtype=np.uint8)
+
+        for start in range(0, len(data), ROTOR_CHUNK):
+            c = data[start:start + ROTOR_CHUNK]
+            n = len(c)
+            steps = STEPS[:n]
+            positions = []
+            carry = None
+            for i in range(nr):
+                #pos[i] moves by its increment every byte, plus one for every carry out of the rotor before it
+                #(all of it is mod 256, so uint8 wrapping does the % size)
+                p = steps * np.uint8(increments[i])
+                p += np.uint8(pos[i])
+                if carry is None:
+                    pos[i] = (int(p[-1]) + increments[i]) % size
+                    carry = (p >= size - increments[i]).view(np.uint8)
+                else:
+                    carried = np.cumsum(carry, dtype=np.uint8)
+                    carried -= carry
+                    p += carried
+                    pos[i] = (int(p[-1]) + int(carry[-1]) + increments[i]) % size
+                    carry = p + carry
+                    carry = (carry >= size - increments[i]).view(np.uint8)
+                positions.append(p)
+
             if do_decrypt:
                 for i in range(nr-1,-1,-1):
-                    c = pos[i] ^ rotors[i][c]
+                    c = positions[i] ^ tables[i][c]
             else:
                 for i in range(nr):
-                    c = rotors[i][c ^ pos[i]]
-            outbuf = outbuf + c.to_bytes(1, "big")
+                    c = tables[i][c ^ positions[i]]
+            result[start:start + n] = c
 
-            pnew = 0
-            for i in range(nr):
-                pnew = ((pos[i] + (pnew >= size)) & 0xff) + rotors[i][size]
-                pos[i] = pnew % size
-
-        return outbuf
+        return out
 
     def get_rotors(self, do_decrypt):
         nr = self.n_rotors
-        rotors = self.rotors
         positions = self.positions[do_decrypt]
 
         if positions is None:
-            if rotors:
-                positions = list(rotors[3])
-            else:
-                self.size = size = 256
-                id_rotor = list(range(size+1))
-
-                rand = random_func(self.key)
-                E = []
-                D = []
-                positions = []
-                for i in range(nr):
-                    i = size
-                    positions.append(rand(i))
-                    erotor = id_rotor[:]
-                    drotor = id_rotor[:]
-                    drotor[i] = erotor[i] = 1 + 2*rand(i/2) # increment
-                    while i > 1:
-                        r = rand(i)
-                        i -= 1
-                        er = erotor[r]
-                        erotor[r] = erotor[i]
-                        erotor[i] = er
-                        drotor[er] = i
-                    drotor[erotor[0]] = 0
-                    E.append(tuple(erotor))
-                    D.append(tuple(drotor))
-                self.rotors = rotors = (
-                    tuple(E), tuple(D), size, tuple(positions))
+            if not self.rotors:
+                self.size = 256
+                self.rotors = rotor_tables(self.key, nr)
+            positions = list(self.rotors[3])
             self.positions[do_decrypt] = positions
-        return rotors[2], nr, rotors[do_decrypt], positions
+        return self.rotors[2], nr, self.rotors[do_decrypt], positions
+
+ROTOR_CHUNK = 1 << 16
+STEPS = np.arange(ROTOR_CHUNK, dtype=np.int64).astype(np.uint8)
+
+#E / D tables and starting positions of a key, they only depend on the key so they are made once per key
+@lru_cache(maxsize=64)
+def rotor_tables(key, nr):
+    size = 256
+    id_rotor = list(range(size+1))
+
+    rand = random_func(key)
+    E = []
+    D = []
+    positions = []
+    for i in range(nr):
+        i = size
+        positions.append(rand(i))
+        erotor = id_rotor[:]
+        drotor = id_rotor[:]
+        drotor[i] = erotor[i] = 1 + 2*rand(i/2) # increment
+        while i > 1:
+            r = rand(i)
+            i -= 1
+            er = erotor[r]
+            erotor[r] = erotor[i]
+            erotor[i] = er
+            drotor[er] = i
+        drotor[erotor[0]] = 0
+        E.append(tuple(erotor))
+        D.append(tuple(drotor))
+    return (tuple(E), tuple(D), size, tuple(positions))
+
+#the same tables as uint8 lookup arrays (without the increment at the end)
+@lru_cache(maxsize=64)
+def rotor_arrays(key, nr):
+    E, D, size, positions = rotor_tables(key, nr)
+    return ([np.array(rotor[:size], dtype=np.uint8) for rotor in E], [np.array(rotor[:size], dtype=np.uint8) for rotor in D])
 
 def random_func(key):
     mask = 0xffff
@@ -0,0 +1,64 @@
+import os, threading
+from concurrent.futures import ThreadPoolExecutor
+
+#finds the NPK files in a folder, with recursive it goes through every subfolder too
+def find_npks(path, recursive=False):
+    if not recursive:
+        return [os.path.join(path, x) for x in sorted(os.listdir(path)) if x.endswith(".npk")]
+    found = []
+    for root, dirs, names in os.walk(path):
+        #"res/" next to "res.npk" is where res.npk was extracted to, the NPK / ZIP files kept in there came out of it
+        dirs[:] = sorted(x for x in dirs if x + ".npk" not in names)
+        found += [os.path.join(root, x) for x in sorted(names) if x.endswith(".npk")]
+    return found
+
+#counter that blocks until there is room for the amount asked for, a limit of 0 means no limit
+#something bigger than the whole limit is still let through once nothing else is running
+class Budget:
+    def __init__(self, limit=0):
+        self.limit = limit
+        self.used = 0
+        self.cond = threading.Condition()
+
+    def acquire(self, amount):
+        with self.cond:
+            while self.limit and self.used and self.used + amount > self.limit:
+                self.cond.wait()
+            self.used += amount
+
+    def release(self, amount):
+        with self.cond:
+            self.used -= amount
+            self.cond.notify_all()
+
+#runs func(path) for every archive, largest first so a huge archive doesnt end up running alone at the end
+#at most "workers" archives run at once, and together they stay under max_open_files handles and max_inflight_bytes
+def run_archives(func, paths, workers=1, max_open_files=0, max_inflight_bytes=0, handles_per_archive=1):
+    sizes = {path: os.path.getsize(path) if os.path.isfile(path) else 0 for path in paths}
+    paths = sorted(paths, key=lambda path: sizes[path], reverse=True)
+    if workers <= 1:
+        for path in paths:
+            func(path)
+        return
+
+    slots = Budget(workers)
+    handles = Budget(max_open_files)
+    inflight = Budget(max_inflight_bytes)
+
+    def run(path):
+        try:
+            return func(path)
+        finally:
+            inflight.release(sizes[path])
+            handles.release(handles_per_archive)
+            slots.release(1)
+
+    futures = []
+    with ThreadPoolExecutor(workers) as pool:
+        for path in paths:
+            slots.acquire(1)
+            handles.acquire(handles_per_archive)
+            inflight.acquire(sizes[path])
+            futures.append(pool.submit(run, path))
+    for future in futures:
+        future.result()
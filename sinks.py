@@ -0,0 +1,193 @@
+import os, io, time, uuid, shutil, tempfile, threading, tarfile, zipfile, sqlite3
+
+#where the extracted files go, every sink takes a path relative to the output ("res/a.mesh") and the data
+#write returns the path it was stored under, the sinks can be written to from several threads at once
+#(only the directory sink can be used by the process backend)
+#entries too big to keep in memory are written a chunk at a time to spool() and then stored with commit (or dropped
+#with discard), the name isnt known until the whole entry went through
+
+#the default, one loose file per entry inside the output folder
+class DirectorySink:
+    def __init__(self, root):
+        self.root = root
+        if not os.path.exists(root):
+            os.mkdir(root)
+
+    def path(self, name):
+        return self.root + "/" + name
+
+    def write(self, name, data):
+        file_path = self.path(name)
+        if "/" in name:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'wb') as dat:
+            dat.write(data)
+        return file_path
+
+    def exists(self, name):
+        return os.path.exists(self.path(name))
+
+    #the spool is a hidden file in the output folder that gets renamed
+    def spool(self):
+        return open(self.path(".{}.part".format(uuid.uuid4().hex)), 'xb')
+
+    def commit(self, spool, name, size):
+        spool.close()
+        file_path = self.path(name)
+        if "/" in name:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        os.replace(spool.name, file_path)
+        return file_path
+
+    def discard(self, spool):
+        spool.close()
+        os.remove(spool.name)
+
+    def close(self):
+        pass
+
+#base for the sinks that put everything in a single file
+class SingleFileSink:
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.lock = threading.Lock()
+
+    def path(self, name):
+        return self.file_path + ":" + name
+
+    def write(self, name, data):
+        with self.lock:
+            self.add(name, data)
+        return self.path(name)
+
+    def exists(self, name):
+        return False
+
+    def spool(self):
+        return tempfile.TemporaryFile()
+
+    def commit(self, spool, name, size):
+        spool.seek(0)
+        with self.lock:
+            self.add_file(name, spool, size)
+        spool.close()
+        return self.path(name)
+
+    def discard(self, spool):
+        spool.close()
+
+class TarSink(SingleFileSink):
+    def __init__(self, file_path):
+        super().__init__(file_path)
+        self.tar = tarfile.open(file_path, 'w')
+        self.mtime = time.time()
+
+    def add(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = self.mtime
+        self.tar.addfile(info, io.BytesIO(data))
+
+    def add_file(self, name, f, size):
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = self.mtime
+        self.tar.addfile(info, f)
+
+    def close(self):
+        self.tar.close()
+
+#uncompressed zip, the data is already decompressed once and compressing it again would be the slow part
+class ZipSink(SingleFileSink):
+    def __init__(self, file_path):
+        super().__init__(file_path)
+        self.zip = zipfile.ZipFile(file_path, 'w', zipfile.ZIP_STORED, allowZip64=True)
+
+    def add(self, name, data):
+        self.zip.writestr(name, data)
+
+    def add_file(self, name, f, size):
+        with self.zip.open(name, 'w', force_zip64=size >= zipfile.ZIP64_LIMIT) as out:
+            shutil.copyfileobj(f, out)
+
+    def close(self):
+        self.zip.close()
+
+#SQLite database with one "files" table (name, data)
+class SqliteSink(SingleFileSink):
+    def __init__(self, file_path):
+        super().__init__(file_path)
+        self.db = sqlite3.connect(file_path, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS files (name TEXT PRIMARY KEY, data BLOB)")
+
+    def add(self, name, data):
+        self.db.execute("INSERT OR REPLACE INTO files (name, data) VALUES (?, ?)", (name, data))
+
+    #the blob is made at its final size and filled in chunks
+    def add_file(self, name, f, size):
+        rowid = self.db.execute("INSERT OR REPLACE INTO files (name, data) VALUES (?, zeroblob(?))", (name, size)).lastrowid
+        with self.db.blobopen("files", "data", rowid) as blob:
+            while chunk := f.read(1 << 20):
+                blob.write(chunk)
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+#throws everything away, only counts it (for timing the decoding by itself)
+class NullSink:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.files = 0
+        self.bytes = 0
+
+    def path(self, name):
+        return name
+
+    def write(self, name, data):
+        with self.lock:
+            self.files += 1
+            self.bytes += len(data)
+        return name
+
+    def exists(self, name):
+        return False
+
+    def spool(self):
+        return NullSpool()
+
+    def commit(self, spool, name, size):
+        with self.lock:
+            self.files += 1
+            self.bytes += size
+        return name
+
+    def discard(self, spool):
+        pass
+
+    def close(self):
+        pass
+
+class NullSpool:
+    def write(self, data):
+        return len(data)
+
+    def close(self):
+        pass
+
+SINKS = ['dir', 'tar', 'zip', 'sqlite', 'null']
+
+#folder_path is the output folder of the NPK, the single file sinks put their file next to it
+def make_sink(kind, folder_path):
+    match kind:
+        case 'dir':
+            return DirectorySink(folder_path)
+        case 'tar':
+            return TarSink(folder_path + ".tar")
+        case 'zip':
+            return ZipSink(folder_path + ".zip")
+        case 'sqlite':
+            return SqliteSink(folder_path + ".sqlite")
+        case 'null':
+            return NullSink()
+    raise Exception("UNKNOWN OUTPUT SINK: {}".format(kind))
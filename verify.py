@@ -0,0 +1,94 @@
+import csv, zlib
+from archive import EntryReader, decrypt_entries, stream_entry, should_stream, STREAM_CHUNK
+from decompression import zflag_decompress
+from decryption import file_decrypt
+from index import INDEX_FIELDS
+from workers import run_entries
+
+#EntryReader that keeps the CRC32 of everything read from it
+class CrcEntryReader(EntryReader):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.crc32 = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.crc32 = zlib.crc32(data, self.crc32)
+        return data
+
+#the small entries of a batch are read and decrypted together (run_entries gives the result to verify_entry)
+def prepare_entries(reader, keys, context, tasks):
+    pkg_type, key = context[:2]
+    return decrypt_entries(reader, keys, pkg_type, [item for _, item, _ in tasks], key)
+
+#checks one entry against its index: zcrc is the CRC32 of the (decrypted) compressed data and crc the one of the
+#decompressed data, raises with the reason when something doesnt match
+#the entries bigger than stream_size are checked a chunk at a time (see should_stream)
+#stored is the (data, algorithm) decrypt_entries gave for the entry, None to read and decrypt it here
+def verify_entry(reader, keys, context, i, item, name, stored=None):
+    pkg_type, key, zstd_dict, stream_size = context
+    file_sign, file_offset, file_length, file_original_length, zcrc, crc, zflag, file_flag = item
+    if should_stream(stream_size, file_length, file_original_length, zflag):
+        return verify_streamed(reader, keys, pkg_type, key, zstd_dict, item, name)
+    if stored is not None:
+        data = stored[0]
+    else:
+        data = reader.read(file_offset, file_length)
+        if len(data) != file_length:
+            raise Exception("TRUNCATED: {} OF {} BYTES".format(len(data), file_length))
+        if pkg_type:
+            data = keys.decrypt(data)
+        data = file_decrypt(file_flag, data, key, crc, file_length, file_original_length)
+    if zlib.crc32(data) != zcrc:
+        raise Exception("ZCRC MISMATCH: {:08X} INSTEAD OF {:08X}".format(zlib.crc32(data), zcrc))
+    data = zflag_decompress(zflag, data, file_original_length, zstd_dict)
+    if len(data) != file_original_length:
+        raise Exception("LENGTH MISMATCH: {} INSTEAD OF {}".format(len(data), file_original_length))
+    if zlib.crc32(data) != crc:
+        raise Exception("CRC MISMATCH: {:08X} INSTEAD OF {:08X}".format(zlib.crc32(data), crc))
+    return name
+
+def verify_streamed(reader, keys, pkg_type, key, zstd_dict, item, name):
+    file_sign, file_offset, file_length, file_original_length, zcrc, crc, zflag, file_flag = item
+    source = CrcEntryReader(reader, keys, pkg_type, file_flag, crc, file_offset, file_length, file_original_length, key)
+    size = 0
+    data_crc = 0
+    error = None
+    try:
+        for chunk in stream_entry(source, zflag, zstd_dict):
+            size += len(chunk)
+            data_crc = zlib.crc32(chunk, data_crc)
+    except Exception as e:
+        error = e
+    #the rest of the compressed data (after the end of the stream or of a corrupt one) is read for the zcrc, which is
+    #checked first like for the entries read whole
+    while source.read(STREAM_CHUNK):
+        pass
+    if source.crc32 != zcrc:
+        raise Exception("ZCRC MISMATCH: {:08X} INSTEAD OF {:08X}".format(source.crc32, zcrc))
+    if error is not None:
+        raise error
+    if size != file_original_length:
+        raise Exception("LENGTH MISMATCH: {} INSTEAD OF {}".format(size, file_original_length))
+    if data_crc != crc:
+        raise Exception("CRC MISMATCH: {:08X} INSTEAD OF {:08X}".format(data_crc, crc))
+    return name
+
+#verifies the selected entries of an open NpkArchive, writes a CSV report (index, name, status, reason)
+#and returns how many entries passed and failed, key_length is the EXPK keystream the entries that arent streamed need
+def verify_archive(archive, selected, report_path, jobs=1, backend='thread', key=0, key_length=0, stream_size=0):
+    columns = [archive.index[field].tolist() for field in INDEX_FIELDS]
+    tasks = ((i, tuple(column[i] for column in columns), archive.name(i)) for i in selected.tolist())
+    passed = failed = 0
+    with open(report_path, 'w', newline='') as report:
+        writer = csv.writer(report)
+        writer.writerow(['index', 'name', 'status', 'reason'])
+        for result in run_entries(verify_entry, tasks, (archive.pkg_type, key, archive.zstd_dict, stream_size), archive.reader, archive.keys, archive.path, jobs, backend, key_length, prepare_entries):
+            if result.error is None:
+                passed += 1
+                writer.writerow([result.index, result.file_path, 'PASS', ''])
+            else:
+                failed += 1
+                writer.writerow([result.index, archive.name(result.index), 'FAIL', result.error])
+                print(f"FAIL: file index {result.index}: {result.error}")
+    return passed, failed
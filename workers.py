@@ -0,0 +1,84 @@
+import os
+from itertools import islice
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from key import Keys
+from reader import NpkReader
+
+#outcome of one index entry, error is None when it went fine
+EntryResult = namedtuple('EntryResult', ['index', 'file_path', 'error'])
+
+#per process state for the process backend, every worker opens the NPK once
+_worker = {}
+
+#threads are enough when the work is zlib / lz4 / zstd and the NumPy XORs (they release the GIL),
+#growing the EXPK keystream is pure python so EXPK files use processes
+def choose_backend(pkg_type, file_flags):
+    if pkg_type:
+        return 'process'
+    return 'thread'
+
+#tasks are handed out (and given to prepare) at most this many at a time
+BATCH = 256
+
+def _run(func, reader, keys, context, task):
+    try:
+        return EntryResult(task[0], func(reader, keys, context, *task), None)
+    except Exception as e:
+        return EntryResult(task[0], None, str(e))
+
+#prepare gets the whole batch and returns one more value for every task, if it fails the tasks get None
+def _run_batch(func, prepare, reader, keys, context, tasks):
+    if prepare is not None:
+        try:
+            tasks = [task + (value,) for task, value in zip(tasks, prepare(reader, keys, context, tasks))]
+        except Exception:
+            tasks = [task + (None,) for task in tasks]
+    return [_run(func, reader, keys, context, task) for task in tasks]
+
+def _batches(tasks, size):
+    tasks = iter(tasks)
+    while batch := list(islice(tasks, size)):
+        yield batch
+
+def _init_process(path, use_mmap, func, prepare, context, keys_handle):
+    f = open(path, 'rb')
+    _worker['reader'] = NpkReader(f, use_mmap)
+    _worker['keys'] = Keys.attach(keys_handle)
+    _worker['func'] = func
+    _worker['prepare'] = prepare
+    _worker['context'] = context
+
+def _run_in_process(tasks):
+    return _run_batch(_worker['func'], _worker['prepare'], _worker['reader'], _worker['keys'], _worker['context'], tasks)
+
+#runs func(reader, keys, context, *task) for every task and yields an EntryResult per task, in task order
+#task[0] has to be the entry index, with jobs <= 1 everything runs in the calling thread
+#with prepare the tasks go in batches to prepare(reader, keys, context, tasks) first, which returns a value per task
+#that is given to func after the task (so work can be shared by a run of entries, like decrypt_entries)
+#key_length is how much of the EXPK keystream the tasks need (0 for NXPK), it is generated once here and shared with
+#the processes
+def run_entries(func, tasks, context, reader, keys, path, jobs=1, backend='thread', key_length=0, prepare=None):
+    if jobs <= 1:
+        for batch in _batches(tasks, BATCH):
+            yield from _run_batch(func, prepare, reader, keys, context, batch)
+        return
+    #small enough batches that every worker gets several
+    tasks = list(tasks)
+    size = max(1, min(BATCH, len(tasks) // (jobs * 16)))
+    if backend == 'process':
+        shared = keys.share(key_length) if key_length else None
+        try:
+            with ProcessPoolExecutor(jobs, initializer=_init_process, initargs=(path, reader.map is not None, func, prepare, context, shared.handle if shared else None)) as pool:
+                for results in pool.map(_run_in_process, _batches(tasks, size)):
+                    yield from results
+        finally:
+            if shared is not None:
+                shared.close()
+    else:
+        with ThreadPoolExecutor(jobs) as pool:
+            for results in pool.map(lambda batch: _run_batch(func, prepare, reader, keys, context, batch), _batches(tasks, size)):
+                yield from results
+
+def default_jobs():
+    return os.cpu_count() or 1